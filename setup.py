@@ -39,6 +39,15 @@ EXTRAS_REQUIRE = {
         "coverage[toml]",
         "pytest-cov",
     ],
+    "xxhash": [
+        "xxhash",
+    ],
+    "blake3": [
+        "blake3",
+    ],
+    "numpy": [
+        "numpy",
+    ],
     "docs": [
         "sphinx",
         "sphinx_rtd_theme",
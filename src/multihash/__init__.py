@@ -8,10 +8,27 @@ __author__ = "Brian Balsamo"
 __email__ = "Brian@BrianBalsamo.com"
 __version__ = "2.0.1"
 
-import hashlib
-from json import dumps
+import os
 from os import PathLike
-from typing import Any, BinaryIO, Dict, Iterable, Optional, Set, Union
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Union,
+)
+
+# The rest of the package is imported where it's needed, so importing
+# multihash, eg: to start the CLI, stays fast.
+# pylint: disable=import-outside-toplevel
+
+if TYPE_CHECKING:  # pragma: no cover
+    from multihash.archive import Member
 
 # There's some weirdness here wrt typing checking the Protocol import itself.
 # See https://github.com/python/mypy/issues/4427
@@ -31,11 +48,22 @@ class HasherType(Protocol):  # pragma: no cover
     These are classes that actually compute the hashes.
     """
 
-    name: str
-    digest_size: int
-    block_size: int
+    @property
+    def name(self) -> str:
+        """Return the name of the algorithm."""
+        ...
+
+    @property
+    def digest_size(self) -> int:
+        """Return the size of the digest, in bytes."""
+        ...
 
-    def update(self, data: bytes) -> None:
+    @property
+    def block_size(self) -> int:
+        """Return the internal block size of the algorithm, in bytes."""
+        ...
+
+    def update(self, data: Union[bytes, memoryview]) -> None:
         """Update the hasher."""
         ...
 
@@ -70,45 +98,125 @@ class MultiHash:
 
     def __init__(
         self,
-        data: Optional[bytes] = None,
+        data: Optional[Any] = None,
         hashers: Optional[Iterable[Union[HasherType, str]]] = None,
     ):
         """
         Create a new MultiHash instance.
 
-        :param data: Binary data to seed all the hashers with
+        :param data: Binary data to seed all the hashers with, any object
+            supporting the buffer protocol, see `update()`
         :param hashers: Instances of classes conforming to the
-            hashlib.hash interface, or names of hashes appropriate for `new()`
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
         """
         self._hashers: Set[HasherType] = set()
         if hashers is not None:
             self._set_hashers(hashers)
-        if data:
+        if data is not None:
             self.update(data)
 
     @classmethod
     def from_filepath(
         cls,
         filepath: PathLike,
-        hashers: Iterable[Union[HasherType, str]] = None,
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
         chunksize: int = 128000000,  # 128MB
+        offset: int = 0,
+        length: Optional[int] = None,
+        decompress: Optional[str] = None,
     ) -> "MultiHash":
         """
         Instantiate a new MultiHash and hash a file located at some file path.
 
+        When every hasher is a piece hasher, eg: "s3etag" or "treehash", a
+        whole file's pieces are digested in parallel, see
+        `multihash.hashers.update_in_parallel()`.
+
         :param filepath: A file path
         :param hashers: Instances of classes conforming to the
-            hashlib.hash interface, or names of hashes appropriate for `new()`
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
         :param chunksize: How many bytes to read into RAM at once
+        :param offset: The byte offset in the file to start hashing at
+        :param length: How many bytes to hash, None hashes to the end of the file
+        :param decompress: Hash the decompressed content of the file rather
+            than its bytes, one of "gzip", "bz2", "xz" or "auto". See
+            `multihash.compression.hash_decompressed()`.
         """
-        with open(filepath, "rb") as stream:
-            return cls.from_stream(stream, hashers=hashers, chunksize=chunksize)
+        if decompress is not None:
+            if offset or length is not None:
+                raise ValueError("decompress can't be combined with a byte range")
+            from multihash.compression import hash_decompressed
+
+            content, _ = hash_decompressed(
+                filepath, hashers=hashers, compression=decompress, chunksize=chunksize
+            )
+            return content
+        if offset == 0 and length is None:
+            from multihash.hashers import update_in_parallel
+            from multihash.memory import MIN_CHUNKSIZE
+
+            multihash = cls(hashers=hashers)
+            if update_in_parallel(multihash.hashers, filepath, chunksize):
+                return multihash
+            with open(filepath, "rb") as stream:
+                # Small files don't need, or reserve, a whole chunk
+                size = os.fstat(stream.fileno()).st_size
+                chunksize = min(chunksize, max(size, MIN_CHUNKSIZE))
+                return cls.from_stream(
+                    stream, hashers=multihash.hashers, chunksize=chunksize
+                )
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            return cls.from_range(
+                fd, offset=offset, length=length, hashers=hashers, chunksize=chunksize
+            )
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def from_range(
+        cls,
+        file: Union[int, BinaryIO],
+        offset: int = 0,
+        length: Optional[int] = None,
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        chunksize: int = 128000000,  # 128MB
+    ) -> "MultiHash":
+        """
+        Instantiate a new MultiHash and hash a byte range of a seekable file.
+
+        Reads are performed with `os.pread`, so the file position is never
+        used or modified, and many threads may hash separate ranges of the
+        same open file at once. Where `os.pread` isn't available, eg: on
+        Windows, the file position is moved instead, and threads need
+        separate file descriptors.
+
+        :param file: A file descriptor, or an object which implements .fileno()
+        :param offset: The byte offset to start hashing at
+        :param length: How many bytes to hash, None hashes to the end of the file
+        :param hashers: Instances of classes conforming to the
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
+        :param chunksize: How many bytes to read into RAM at once, at most. See
+            `multihash.memory`.
+        """
+        from multihash.memory import MIN_CHUNKSIZE, get_memory_budget
+        from multihash.parallel import iter_range
+
+        fd = file if isinstance(file, int) else file.fileno()
+        multihash = cls(hashers=hashers)
+        with get_memory_budget().reserve(chunksize, MIN_CHUNKSIZE) as chunksize:
+            for chunk in iter_range(fd, offset, length, chunksize):
+                multihash.update(chunk)
+        return multihash
 
     @classmethod
     def from_stream(
         cls,
-        stream: BinaryIO,
-        hashers: Iterable[Union[HasherType, str]] = None,
+        stream: IO[bytes],
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
         chunksize: int = 128000000,  # 128MB
     ) -> "MultiHash":
         """
@@ -117,15 +225,70 @@ class MultiHash:
         :param stream: An object which implements .read()
         :param hashers: Instances of classes conforming to the
             hashlib.hash interface
-        :param chunksize: How many bytes to read into RAM at once
+        :param chunksize: How many bytes to read into RAM at once, at most. See
+            `multihash.memory`.
         """
+        from multihash.memory import MIN_CHUNKSIZE, get_memory_budget
+
         multihash = cls(hashers=hashers)
-        chunk = stream.read(chunksize)
-        while chunk:
-            multihash.update(chunk)
+        with get_memory_budget().reserve(chunksize, MIN_CHUNKSIZE) as chunksize:
             chunk = stream.read(chunksize)
+            while chunk:
+                multihash.update(chunk)
+                chunk = stream.read(chunksize)
+        return multihash
+
+    @classmethod
+    def from_buffer(
+        cls,
+        data: Any,
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        chunksize: int = 8388608,  # 8MiB
+    ) -> "MultiHash":
+        """
+        Instantiate a new MultiHash and hash a buffer protocol object.
+
+        Contiguous buffers, eg: bytearrays, mmaps or C-ordered NumPy arrays,
+        are hashed without copying. Non-contiguous ones, eg: strided array
+        slices, are copied chunksize bytes at a time. See `multihash.buffers`
+        for the byte order used.
+
+        :param data: An object supporting the buffer protocol
+        :param hashers: Instances of classes conforming to the
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
+        :param chunksize: How many bytes of a non-contiguous buffer to copy at once
+        """
+        from multihash.buffers import iter_buffer
+
+        multihash = cls(hashers=hashers)
+        for chunk in iter_buffer(data, chunksize):
+            multihash.update(chunk)
         return multihash
 
+    @classmethod
+    def from_archive(
+        cls,
+        source: Union[str, PathLike, BinaryIO],
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        chunksize: int = 128000000,  # 128MB
+    ) -> Iterator["Member"]:
+        """
+        Hash every regular file in a tar or zip archive, without extracting it.
+
+        Yields `multihash.archive.Member` tuples of the member's name, size
+        and MultiHash. See `multihash.archive.iter_archive()`.
+
+        :param source: A file path, or an object which implements .read()
+        :param hashers: Instances of classes conforming to the
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
+        :param chunksize: How many bytes to read into RAM at once
+        """
+        from multihash.archive import iter_archive
+
+        return iter_archive(source, hashers=hashers, chunksize=chunksize)
+
     def _get_hashers(self) -> Set[HasherType]:
         """Return a set of all the contained "hashers"."""
         return self._hashers
@@ -136,9 +299,11 @@ class MultiHash:
 
         Handles iterables of "hashers" or name strings.
         """
+        from multihash.hashers import new as new_hasher
+
         for hasher in hashers:
             if isinstance(hasher, str):
-                self._hashers.add(hashlib.new(hasher))
+                self._hashers.add(new_hasher(hasher))
             else:
                 self._hashers.add(hasher)
 
@@ -148,20 +313,32 @@ class MultiHash:
 
     def _get_name(self) -> str:
         """Return a name for the MultiHash instance."""
+        from json import dumps
+
         return "MultiHash{}".format(str(dumps([x.name for x in self.hashers])))
 
     def __repr__(self) -> str:
         """Display a nice name if printed."""
         return self._get_name()
 
-    def update(self, data: bytes) -> None:
+    def update(self, data: Any) -> None:
         """
         Update all the underlying hashes with the supplied data.
 
+        Any object supporting the buffer protocol is accepted, and hashed as
+        flat bytes, see `from_buffer()`.
+
         :param data: The data to update the hashes with.
         """
-        for hasher in self.hashers:
-            hasher.update(data)
+        if isinstance(data, bytes):
+            chunks: Iterable[Any] = (data,)
+        else:
+            from multihash.buffers import iter_buffer
+
+            chunks = iter_buffer(data)
+        for chunk in chunks:
+            for hasher in self.hashers:
+                hasher.update(chunk)
 
     def _call_all_hashers(self, method_name: str, *args, **kwargs) -> Dict[str, Any]:
         """
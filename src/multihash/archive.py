@@ -0,0 +1,108 @@
+"""
+Hash the members of tar and zip archives without extracting them.
+
+Members are read and hashed in a single streaming pass, so no scratch space
+is needed and every byte is read only once.
+"""
+
+import tarfile
+import zipfile
+from os import PathLike
+from typing import IO, BinaryIO, Iterable, Iterator, NamedTuple, Optional, Union
+
+from multihash import HasherType, MultiHash
+
+# A zip starts with a local file header, or its end record if it's empty
+_ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+
+
+class Member(NamedTuple):
+    """A hashed member of an archive."""
+
+    name: str
+    size: int
+    hashes: MultiHash
+
+
+def _hash_member(stream: IO[bytes], prototype: MultiHash, chunksize: int) -> MultiHash:
+    """Hash a member's stream with fresh copies of the prototype's hashers."""
+    return MultiHash.from_stream(
+        stream, hashers=prototype.copy().values(), chunksize=chunksize
+    )
+
+
+def _is_zip(source: Union[str, PathLike, BinaryIO]) -> bool:
+    """Check for a zip archive, without moving a stream's position."""
+    if isinstance(source, (str, PathLike)):
+        with open(source, "rb") as stream:
+            return _is_zip(stream)
+    if not source.seekable():
+        # Zips are read through their central directory, which needs seeking
+        return False
+    position = source.tell()
+    try:
+        # is_zipfile() finds a central directory anywhere near the end, eg:
+        # of a tar whose last member is a zip, so check the start too.
+        if source.read(len(_ZIP_MAGIC[0])) not in _ZIP_MAGIC:
+            return False
+        source.seek(position)
+        return zipfile.is_zipfile(source)
+    finally:
+        source.seek(position)
+
+
+def _iter_zip(
+    source: Union[str, PathLike, BinaryIO], prototype: MultiHash, chunksize: int
+) -> Iterator[Member]:
+    """Hash the members of a zip archive, in central directory order."""
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            with archive.open(info) as stream:
+                hashes = _hash_member(stream, prototype, chunksize)
+            yield Member(info.filename, info.file_size, hashes)
+
+
+def _iter_tar(
+    source: Union[str, PathLike, BinaryIO], prototype: MultiHash, chunksize: int
+) -> Iterator[Member]:
+    """Hash the regular file members of a tar archive, in a streaming pass."""
+    if isinstance(source, (str, PathLike)):
+        archive = tarfile.open(source, mode="r|*")
+    else:
+        archive = tarfile.open(fileobj=source, mode="r|*")
+    with archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            stream = archive.extractfile(info)
+            if stream is None:  # pragma: no cover
+                continue  # Only regular files are extracted, which always have data
+            hashes = _hash_member(stream, prototype, chunksize)
+            yield Member(info.name, info.size, hashes)
+
+
+def iter_archive(
+    source: Union[str, PathLike, BinaryIO],
+    hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+    chunksize: int = 128000000,  # 128MB
+) -> Iterator[Member]:
+    """
+    Hash every regular file in a tar or zip archive.
+
+    Tar archives, optionally gzip, bzip2 or xz compressed, are read in
+    stream mode, so non-seekable streams such as pipes are supported. Zip
+    archives are read through their central directory, and so need a file
+    path or a seekable stream.
+
+    :param source: A file path, or an object which implements .read()
+    :param hashers: Instances of classes conforming to the
+        hashlib.hash interface, or names of hashes appropriate for
+        `multihash.hashers.new()`. Instances are copied for each member.
+    :param chunksize: How many bytes to read into RAM at once
+    """
+    prototype = MultiHash(hashers=hashers)
+    if _is_zip(source):
+        return _iter_zip(source, prototype, chunksize)
+    return _iter_tar(source, prototype, chunksize)
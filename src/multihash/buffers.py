@@ -0,0 +1,45 @@
+"""
+Feed any buffer protocol object to hashers, without copying it where possible.
+
+Objects such as bytearrays, mmaps, array.array and NumPy arrays are hashed as
+the bytes `memoryview(data).tobytes()` would return: elements in C
+(row-major) order, each in the byte order it is stored in, which is native
+unless the object's format says otherwise. Convert arrays to an explicit byte
+order first, eg: `array.astype("<f8")`, if digests must match across
+platforms.
+"""
+
+from typing import Any, Iterator
+
+DEFAULT_CHUNKSIZE = 8388608  # 8MiB
+
+
+def iter_buffer(data: Any, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[memoryview]:
+    """
+    Yield the bytes of a buffer protocol object as flat byte memoryviews.
+
+    C-contiguous buffers are yielded whole, without copying. Other buffers
+    are walked along their first axis, yielding views of contiguous slices
+    where possible, and copies of at most chunksize bytes (or one slice along
+    the first axis, if that's larger) otherwise.
+
+    :param data: An object supporting the buffer protocol
+    :param chunksize: How many bytes of a non-contiguous buffer to copy at once
+    """
+    view = memoryview(data)
+    if not view.nbytes:
+        # Zero-size views, eg: of an array shaped (0, 3), can't be cast
+        return
+    if view.c_contiguous:
+        yield view if view.format == "B" and view.ndim == 1 else view.cast("B")
+        return
+    rows = view.shape[0] if view.shape else 0
+    if not rows:
+        return
+    step = max(chunksize // max(view.nbytes // rows, 1), 1)
+    for start in range(0, rows, step):
+        piece = view[start : start + step]
+        if piece.c_contiguous:
+            yield piece.cast("B")
+        else:
+            yield memoryview(piece.tobytes())
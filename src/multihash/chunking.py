@@ -0,0 +1,234 @@
+"""
+Content-defined chunking, with multiple digests per chunk.
+
+Splits a stream into variable sized chunks whose boundaries depend on the
+content itself (FastCDC), so an insertion or deletion only changes the
+chunks around it. Each chunk is hashed with a fresh `MultiHash`, allowing
+deduplication at sub-file granularity in a single pass with constant memory.
+
+Finding cut points means updating a fingerprint for every byte. In pure
+Python that runs at around 5MB/s, which suits small inputs but not large
+files. When NumPy is installed (the "numpy" extra) the fingerprints of a
+whole read are computed at once, which is over ten times faster, and the
+chunk boundaries are the same either way.
+"""
+
+import hashlib
+from importlib import import_module
+from typing import (
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from multihash import HasherType, MultiHash
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# A fixed gear table, so chunk boundaries are stable between runs and versions.
+_GEAR = tuple(
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256)
+)
+# How many fingerprints are computed at once with NumPy
+_BLOCK = 65536
+
+
+class Chunk(NamedTuple):
+    """A content-defined chunk of a stream."""
+
+    offset: int
+    length: int
+    hashes: MultiHash
+
+
+def _mask(bits: int) -> int:
+    """Return a mask selecting the high bits of the 64 bit gear fingerprint."""
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+def _cut_point(
+    data: bytes,
+    start: int,
+    end: int,
+    sizes: Tuple[int, int, int],
+    mask_small: int,
+    mask_large: int,
+) -> int:
+    """
+    Return the length of the chunk starting at data[start].
+
+    Uses the stricter mask before the average size and the looser one after,
+    normalizing chunk sizes around the average.
+    """
+    min_size, avg_size, max_size = sizes
+    available = end - start
+    if available <= min_size:
+        return available
+    limit = min(available, max_size)
+    normal = min(avg_size, limit)
+    gear = _GEAR
+    fingerprint = 0
+    for i in range(start + min_size, start + normal):
+        fingerprint = ((fingerprint << 1) + gear[data[i]]) & _MASK64
+        if not fingerprint & mask_small:
+            return i - start + 1
+    for i in range(start + normal, start + limit):
+        fingerprint = ((fingerprint << 1) + gear[data[i]]) & _MASK64
+        if not fingerprint & mask_large:
+            return i - start + 1
+    return limit
+
+
+def _numpy() -> Any:
+    """Return the numpy module, or None if it isn't installed."""
+    try:
+        return import_module("numpy")
+    except ImportError:
+        return None
+
+
+def _candidates(numpy: Any, data: bytes, mask_small: int, mask_large: int) -> Any:
+    """
+    Return the positions in data where each mask matches the fingerprint.
+
+    Each byte is shifted out of the 64 bit fingerprint 64 bytes later, so the
+    fingerprint at a position is a sum over the 64 bytes ending there, which
+    is computed for every position at once by doubling the window six times,
+    a cache sized block at a time.
+    """
+    gear = numpy.array(_GEAR, dtype=numpy.uint64)
+    values = numpy.frombuffer(data, dtype=numpy.uint8)
+    shifted = numpy.empty(_BLOCK + 63, dtype=numpy.uint64)
+    found = []
+    for block in range(0, len(values), _BLOCK):
+        # Include the 63 bytes before the block, to fill its first windows
+        lead = min(block, 63)
+        fingerprints = gear[values[block - lead : block + _BLOCK]]
+        size = len(fingerprints)
+        for shift in (1, 2, 4, 8, 16, 32):
+            numpy.left_shift(
+                fingerprints[:-shift], numpy.uint64(shift), out=shifted[shift:size]
+            )
+            fingerprints[shift:] += shifted[shift:size]
+        # The small mask's bits include the large mask's
+        matches = numpy.flatnonzero((fingerprints & numpy.uint64(mask_large)) == 0)
+        matches = matches[matches >= lead]
+        small = (fingerprints[matches] & numpy.uint64(mask_small)) == 0
+        found.append((matches[small] + (block - lead), matches + (block - lead)))
+    if not found:
+        return numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.intp)
+    return tuple(numpy.concatenate(positions) for positions in zip(*found))
+
+
+def _cut_point_numpy(  # pylint: disable=R0913
+    numpy: Any,
+    data: bytes,
+    start: int,
+    end: int,
+    sizes: Tuple[int, int, int],
+    mask_small: int,
+    mask_large: int,
+    candidates: Any,
+) -> int:
+    """
+    Return the length of the chunk starting at data[start], as `_cut_point`.
+
+    The fingerprint starts from zero min_size bytes into the chunk, so it only
+    matches the 64 byte window sum in candidates 63 bytes later. The
+    positions before that are checked in pure Python.
+    """
+    min_size, avg_size, max_size = sizes
+    available = end - start
+    if available <= min_size:
+        return available
+    limit = min(available, max_size)
+    normal = min(avg_size, limit)
+    gear = _GEAR
+    fingerprint = 0
+    head = min(start + min_size + 63, start + limit)
+    for i in range(start + min_size, head):
+        fingerprint = ((fingerprint << 1) + gear[data[i]]) & _MASK64
+        if not fingerprint & (mask_small if i < start + normal else mask_large):
+            return i - start + 1
+    small, large = candidates
+    index = numpy.searchsorted(small, head)
+    if index < len(small) and small[index] < start + normal:
+        return int(small[index]) - start + 1
+    index = numpy.searchsorted(large, max(head, start + normal))
+    if index < len(large) and large[index] < start + limit:
+        return int(large[index]) - start + 1
+    return limit
+
+
+def iter_chunks(
+    stream: BinaryIO,
+    hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+    min_size: int = 2048,  # 2KiB
+    avg_size: int = 8192,  # 8KiB
+    max_size: int = 65536,  # 64KiB
+    chunksize: int = 1048576,  # 1MiB
+) -> Iterator[Chunk]:
+    """
+    Split a .read()-able thing into content-defined chunks and hash each one.
+
+    :param stream: An object which implements .read()
+    :param hashers: Instances of classes conforming to the
+        hashlib.hash interface, or names of hashes appropriate for
+        `multihash.hashers.new()`. Instances are copied for each chunk.
+    :param min_size: The minimum chunk size, in bytes
+    :param avg_size: The target average chunk size, in bytes, a power of two
+    :param max_size: The maximum chunk size, in bytes
+    :param chunksize: How many bytes to read into RAM at once
+    """
+    if not 0 < min_size <= avg_size <= max_size:
+        raise ValueError("Chunk sizes must satisfy 0 < min <= avg <= max")
+    if avg_size & (avg_size - 1):
+        raise ValueError("avg_size must be a power of two")
+    bits = avg_size.bit_length() - 1
+    mask_small, mask_large = _mask(bits + 1), _mask(max(bits - 1, 1))
+    sizes = (min_size, avg_size, max_size)
+    prototype = MultiHash(hashers=hashers)
+    chunksize = max(chunksize, max_size)
+    numpy = _numpy()
+
+    buffer = b""
+    candidates = None
+    position = 0
+    offset = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - position < max_size:
+            data = stream.read(chunksize)
+            eof = not data
+            buffer = buffer[position:] + data
+            position = 0
+            if numpy is not None:
+                candidates = _candidates(numpy, buffer, mask_small, mask_large)
+            continue
+        if position == len(buffer):
+            return
+        if numpy is None:
+            length = _cut_point(
+                buffer, position, len(buffer), sizes, mask_small, mask_large
+            )
+        else:
+            length = _cut_point_numpy(
+                numpy,
+                buffer,
+                position,
+                len(buffer),
+                sizes,
+                mask_small,
+                mask_large,
+                candidates,
+            )
+        hashes = MultiHash(hashers=prototype.copy().values())
+        hashes.update(buffer[position : position + length])
+        yield Chunk(offset, length, hashes)
+        position += length
+        offset += length
@@ -2,17 +2,34 @@
 A minimal CLI for some multihash functionality.
 
 Avoids external dependencies, as multihash is primarily a library.
+
+Modules are imported by the functions which need them, rather than here, as
+the CLI may be started many times over, and most runs only need a few.
 """
+# pylint: disable=import-outside-toplevel
 
 import argparse
-from json import dumps
+import os
+import sys
 
 from multihash import MultiHash
 
 
+def parse_size(value):
+    """Parse a size argument, see `multihash.hashers.parse_size()`."""
+    from multihash.hashers import parse_size as parse
+
+    return parse(value)
+
+
 def build_parser():
     """Build the parser for the CLI arguments."""
-    parser = argparse.ArgumentParser(description="Compute multiple hashes.")
+    parser = argparse.ArgumentParser(
+        description="Compute multiple hashes.",
+        epilog="Run 'multihash coordinate' or 'multihash worker' with --help to "
+        "distribute hashing across hosts, 'multihash serve' to run a daemon, or "
+        "'multihash build-known-index' to prebuild a --known index.",
+    )
     parser.add_argument(
         "-c",
         "--chunksize",
@@ -20,34 +37,552 @@ def build_parser():
         type=int,
         help="How much (maximum) of the file to read into RAM at once.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="How many files to hash at once, 1 by default.",
+    )
+    parser.add_argument(
+        "--per-device",
+        type=int,
+        help="With --workers, how many files to hash at once on each disk or "
+        "mount, taking turns between them.",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=parse_size,
+        help="Limit the memory used by read buffers, eg: 512MiB. Chunks shrink, "
+        "and files wait their turn, rather than exceeding it.",
+    )
     parser.add_argument(
         "-a",
         "--algos",
         action="append",
-        help="The algorithm to use to hash the target(s). Repeatable.",
+        help="The algorithm to use to hash the target(s), eg: sha256, crc32, "
+        "s3etag:8MiB or treehash:1MiB. Repeatable. When every algorithm is "
+        "s3etag or treehash, a file's pieces are hashed in parallel.",
     )
-    parser.add_argument("filepaths", nargs="+", help="Filepaths to hash.")
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Treat the target(s) as tar or zip archives, and hash their members "
+        "without extracting them.",
+    )
+    parser.add_argument(
+        "--decompress",
+        nargs="?",
+        const="auto",
+        choices=["auto", "gzip", "bz2", "xz"],
+        help="Hash the decompressed content of the target(s). The format is "
+        "detected if not given.",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="With --decompress, also hash the compressed bytes in the same pass.",
+    )
+    parser.add_argument(
+        "--known",
+        help="A file of known digests, one hex digest per line, or an index "
+        "saved by 'multihash build-known-index', which loads instantly.",
+    )
+    parser.add_argument(
+        "--known-algo",
+        help="The algorithm the known digests were computed with, one of "
+        "--algos. Defaults to the first of --algos.",
+    )
+    parser.add_argument(
+        "--known-action",
+        default="suppress",
+        choices=["suppress", "flag"],
+        help="Whether to leave known files out of the output, or mark them with "
+        '"known": true, which needs --format json.',
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        default="json",
+        choices=["json", "binary"],
+        help="The output format. binary writes a compact manifest, see "
+        "multihash.manifest.",
+    )
+    parser.add_argument(
+        "--check",
+        metavar="MANIFEST",
+        help="Rehash the files listed in a JSON or binary manifest and report "
+        "which still match, instead of hashing filepaths.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep hashing appended bytes, printing a JSON line whenever a file "
+        "changes. Truncated or rotated files are rehashed from the start. Files "
+        "rewritten in place are only noticed if their last 4KiB hashed changed.",
+    )
+    parser.add_argument(
+        "--interval",
+        default=10.0,
+        type=float,
+        help="How many seconds to wait between checks, with --follow.",
+    )
+    parser.add_argument(
+        "--daemon",
+        metavar="SOCKET",
+        help="Forward the filepaths to a daemon started with 'multihash serve', "
+        "listening on this Unix socket, which hashes them with its own settings. "
+        "Defaults to $MULTIHASH_DAEMON, which is skipped if the daemon isn't "
+        "running, or with --workers, --per-device or --max-memory.",
+    )
+    parser.add_argument("filepaths", nargs="*", help="Filepaths to hash.")
     return parser
 
 
-def compute(filepaths, algos, chunksize):
+def filter_known(results, index, algo, action="suppress"):
+    """
+    Suppress or flag the digests in the results which are in a known index.
+
+    Nested results, eg: of archive members, are filtered recursively.
+    """
+    filtered = {}
+    for key, value in results.items():
+        if isinstance(value.get(algo), str):
+            if value[algo] in index:
+                if action == "suppress":
+                    continue
+                value = dict(value, known=True)
+        elif all(isinstance(child, dict) for child in value.values()):
+            value = filter_known(value, index, algo, action)
+        filtered[key] = value
+    return filtered
+
+
+def compute(  # pylint: disable=R0913
+    filepaths,
+    algos,
+    chunksize,
+    archive=False,
+    decompress=None,
+    raw=False,
+    workers=1,
+    per_device=None,
+):
     """Given the parameters computed the JSON output."""
+    from multihash.engine import hash_files
+
+    if decompress is not None:
+        return {
+            filepath: _compute_decompressed(filepath, algos, chunksize, decompress, raw)
+            for filepath in filepaths
+        }
+    if archive:
+        return {
+            filepath: {
+                member.name: member.hashes.hexdigest()
+                for member in MultiHash.from_archive(
+                    filepath, hashers=algos, chunksize=chunksize
+                )
+            }
+            for filepath in filepaths
+        }
     return {
-        filepath: MultiHash.from_filepath(
-            filepath, hashers=algos, chunksize=chunksize
-        ).hexdigest()
-        for filepath in filepaths
+        filepath: multihash.hexdigest()
+        for filepath, multihash in hash_files(
+            filepaths,
+            hashers=algos,
+            chunksize=chunksize,
+            max_workers=workers,
+            per_device=per_device,
+        )
     }
 
 
-def print_results(results):
+def _compute_decompressed(filepath, algos, chunksize, decompress, raw):
+    """Compute the digests of a decompressed file, and optionally its raw bytes."""
+    from multihash.compression import hash_decompressed
+
+    content, raw_hashes = hash_decompressed(
+        filepath,
+        hashers=algos,
+        raw_hashers=algos if raw else None,
+        compression=decompress,
+        chunksize=chunksize,
+    )
+    if raw_hashes is None:
+        return content.hexdigest()
+    return {"content": content.hexdigest(), "raw": raw_hashes.hexdigest()}
+
+
+def _iter_manifest(stream):
+    """Yield the paths and digests in a JSON or binary manifest."""
+    from json import load
+
+    from multihash.manifest import MAGIC, read_manifest
+
+    if stream.read(len(MAGIC)) == MAGIC:
+        stream.seek(0)
+        yield from read_manifest(stream)
+        return
+    stream.seek(0)
+    yield from load(stream).items()
+
+
+def check(manifest_path, chunksize):
+    """
+    Rehash the files in a manifest, reporting which still match.
+
+    Each path maps to "ok", "mismatch", or an error message.
+    """
+    report = {}
+    with open(manifest_path, "rb") as stream:
+        for path, expected in _iter_manifest(stream):
+            report[path] = _check_file(path, expected, chunksize)
+    return report
+
+
+def _check_file(path, expected, chunksize):
+    """Rehash a file, returning "ok", "mismatch", or an error message."""
+    if not isinstance(expected, dict):
+        # eg: the byte ranges of a file split between workers
+        return "error: no digests to check"
+    if "error" in expected:
+        return "error: {}".format(expected["error"])
+    expected = {
+        name: value
+        for name, value in expected.items()
+        if isinstance(value, (bytes, str))
+    }
+    if not expected:
+        # eg: archive members, or content and raw digests, which are nested
+        return "error: no digests to check"
+    try:
+        multihash = MultiHash.from_filepath(
+            path, hashers=list(expected), chunksize=chunksize
+        )
+    except (OSError, ValueError) as exc:
+        return "error: {}".format(exc)
+    digests, hexdigests = multihash.digest(), multihash.hexdigest()
+    actual = {
+        name: digests[name] if isinstance(value, bytes) else hexdigests[name]
+        for name, value in expected.items()
+    }
+    return "ok" if actual == expected else "mismatch"
+
+
+def follow(filepaths, algos, chunksize, interval, rounds=None):
+    """
+    Hash files as they grow, yielding a record whenever one changes.
+
+    Runs forever, unless a number of rounds is given.
+    """
+    import time
+
+    from multihash.incremental import IncrementalFileHash
+
+    trackers = [
+        IncrementalFileHash(filepath, hashers=algos, chunksize=chunksize)
+        for filepath in filepaths
+    ]
+    last = {}
+    completed = 0
+    while rounds is None or completed < rounds:
+        if completed:
+            time.sleep(interval)
+        for tracker in trackers:
+            try:
+                multihash = tracker.refresh()
+            except OSError as exc:
+                record = {"path": tracker.filepath, "error": str(exc)}
+            else:
+                record = {
+                    "path": tracker.filepath,
+                    "offset": tracker.offset,
+                    "restarted": tracker.restarted,
+                    "digests": multihash.hexdigest(),
+                }
+            state = {key: value for key, value in record.items() if key != "restarted"}
+            if record.get("restarted") or state != last.get(tracker.filepath):
+                last[tracker.filepath] = state
+                yield record
+        completed += 1
+
+
+def print_results(results, output_format="json"):
     """Print the results."""
+    if output_format == "binary":
+        from multihash.manifest import write_manifest
+
+        write_manifest(sys.stdout.buffer, results)
+        sys.stdout.buffer.flush()
+        return
+    from json import dumps
+
     print(dumps(results, indent=2))
 
 
+def build_coordinate_parser():
+    """Build the parser for the coordinate command's arguments."""
+    parser = argparse.ArgumentParser(
+        prog="multihash coordinate",
+        description="Hand out files to hash to workers, and print the manifest.",
+    )
+    parser.add_argument(
+        "-l",
+        "--listen",
+        required=True,
+        help="The address to listen for workers on, HOST:PORT or unix:PATH.",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunksize",
+        default=128000000,  # 128MB
+        type=int,
+        help="How much (maximum) of the file workers read into RAM at once.",
+    )
+    parser.add_argument(
+        "-a",
+        "--algos",
+        action="append",
+        help="The algorithm to use to hash the target(s). Repeatable.",
+    )
+    parser.add_argument(
+        "--split-size",
+        type=parse_size,
+        help="Split files larger than this, eg: 1GiB, into byte ranges hashed "
+        "separately.",
+    )
+    parser.add_argument(
+        "--attempts",
+        default=3,
+        type=int,
+        help="How many times to try each file before giving up.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="How many seconds to wait for a worker before retrying elsewhere.",
+    )
+    parser.add_argument("filepaths", nargs="+", help="Filepaths to hash.")
+    return parser
+
+
+def build_worker_parser():
+    """Build the parser for the worker command's arguments."""
+    parser = argparse.ArgumentParser(
+        prog="multihash worker",
+        description="Hash files handed out by a coordinator.",
+    )
+    parser.add_argument(
+        "--connect",
+        required=True,
+        help="The coordinator's address, HOST:PORT or unix:PATH.",
+    )
+    return parser
+
+
+def build_serve_parser():
+    """Build the parser for the serve command's arguments."""
+    parser = argparse.ArgumentParser(
+        prog="multihash serve",
+        description="Run a daemon which hashes files for 'multihash --daemon'.",
+    )
+    parser.add_argument(
+        "--socket",
+        required=True,
+        help="The path of the Unix socket to listen on.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="How many files to hash at once.",
+    )
+    return parser
+
+
+def build_known_index_parser():
+    """Build the parser for the build-known-index command's arguments."""
+    parser = argparse.ArgumentParser(
+        prog="multihash build-known-index",
+        description="Build an index of known digests once, for fast use with "
+        "'multihash --known'.",
+    )
+    parser.add_argument(
+        "--bloom-error-rate",
+        default=0.01,
+        type=float,
+        help="The false positive rate of the index's Bloom filter, 0 for none.",
+    )
+    parser.add_argument(
+        "digests", help="A file of known digests, one hex digest per line."
+    )
+    parser.add_argument("index", help="The path to save the index to.")
+    return parser
+
+
+def coordinate(argv):
+    """Run a coordinator, printing the manifest once every file is hashed."""
+    from multihash.distributed import Coordinator
+
+    args = build_coordinate_parser().parse_args(argv)
+    coordinator = Coordinator(
+        args.listen,
+        args.filepaths,
+        algos=args.algos,
+        chunksize=args.chunksize,
+        split_size=args.split_size,
+        max_attempts=args.attempts,
+        timeout=args.timeout,
+    )
+    print_results(coordinator.run())
+
+
+def worker(argv):
+    """Run a worker until its coordinator is done."""
+    from multihash.distributed import run_worker
+
+    args = build_worker_parser().parse_args(argv)
+    run_worker(args.connect)
+
+
+def serve(argv):
+    """Run a daemon until interrupted."""
+    from multihash.daemon import HashDaemon
+
+    args = build_serve_parser().parse_args(argv)
+    try:
+        HashDaemon(args.socket, workers=args.workers).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def build_known_index(argv):
+    """Build an index of known digests from a text file, and save it."""
+    from multihash.known import KnownHashIndex
+
+    args = build_known_index_parser().parse_args(argv)
+    index = KnownHashIndex.from_hexfile(args.digests, args.bloom_error_rate or None)
+    index.save(args.index)
+
+
+# Commands which may be given as the first argument, instead of filepaths.
+COMMANDS = {
+    "coordinate": coordinate,
+    "worker": worker,
+    "serve": serve,
+    "build-known-index": build_known_index,
+}
+
+
+def _request_daemon(parser, args):
+    """
+    Hash the filepaths with a daemon, if one should be used.
+
+    Returns None if they should be hashed here instead. Exits if any file
+    couldn't be hashed.
+    """
+    local = [
+        option
+        for option, value in (
+            ("--workers", args.workers),
+            ("--per-device", args.per_device),
+            ("--max-memory", args.max_memory),
+        )
+        if value is not None
+    ]
+    if args.daemon and local:
+        parser.error("{} can't be combined with --daemon".format(", ".join(local)))
+    socket_path = args.daemon or (not local and os.environ.get("MULTIHASH_DAEMON"))
+    if not socket_path or args.archive or args.decompress is not None:
+        return None
+    from multihash.daemon import request
+
+    try:
+        results = request(socket_path, args.filepaths, args.algos, args.chunksize)
+    except OSError as exc:
+        if args.daemon:
+            sys.exit("multihash: couldn't reach the daemon: {}".format(exc))
+        return None  # The daemon in the environment isn't running
+    errors = [(path, value) for path, value in results.items() if "error" in value]
+    if errors:
+        # Fail as hashing here would, rather than printing the errors as results
+        for path, value in errors:
+            print("multihash: {}: {}".format(path, value["error"]), file=sys.stderr)
+        sys.exit(1)
+    return results
+
+
+def _known_algo(parser, args):
+    """Return the name of the hash --known digests are compared with."""
+    from multihash.hashers import new as new_hasher
+
+    if not args.algos:
+        parser.error("--known requires --algos")
+    if args.format == "binary" and args.known_action == "flag":
+        parser.error("--known-action flag can't be combined with --format binary")
+    try:
+        # Results are keyed by hasher name, which may differ from the given one
+        algos = [new_hasher(name).name for name in args.algos]
+        algo = new_hasher(args.known_algo).name if args.known_algo else algos[0]
+    except ValueError as exc:
+        parser.error(str(exc))
+    if algo not in algos:
+        parser.error("--known-algo {} isn't one of --algos".format(args.known_algo))
+    return algo
+
+
 def cli():
     """Run a simple CLI interface for multihash to hash files."""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
     parser = build_parser()
     args = parser.parse_args()
-    result = compute(args.filepaths, args.algos, args.chunksize)
-    print_results(result)
+    if args.max_memory is not None:
+        from multihash.memory import set_memory_budget
+
+        set_memory_budget(args.max_memory)
+    if args.check:
+        report = check(args.check, args.chunksize)
+        if not report:
+            sys.exit("multihash: no files to check in {}".format(args.check))
+        print_results(report)
+        sys.exit(0 if all(status == "ok" for status in report.values()) else 1)
+    if not args.filepaths:
+        parser.error("filepaths are required, unless using --check")
+    if args.archive and args.decompress is not None:
+        parser.error("--archive can't be combined with --decompress")
+    if args.raw and args.decompress is None:
+        parser.error("--raw requires --decompress")
+    if args.follow:
+        from json import dumps
+
+        for record in follow(args.filepaths, args.algos, args.chunksize, args.interval):
+            print(dumps(record), flush=True)
+        return
+    if args.format == "binary" and (args.archive or args.raw):
+        parser.error("--format binary can't be combined with --archive or --raw")
+    index = algo = None
+    if args.known:
+        from multihash.known import KnownHashIndex
+
+        algo = _known_algo(parser, args)
+        try:
+            index = KnownHashIndex.open(args.known)
+        except (OSError, ValueError) as exc:
+            parser.error("--known {}: {}".format(args.known, exc))
+    result = _request_daemon(parser, args)
+    if result is None:
+        result = compute(
+            args.filepaths,
+            args.algos,
+            args.chunksize,
+            archive=args.archive,
+            decompress=args.decompress,
+            raw=args.raw,
+            workers=args.workers or 1,
+            per_device=args.per_device,
+        )
+    if index is not None:
+        result = filter_known(result, index, algo, args.known_action)
+    print_results(result, args.format)
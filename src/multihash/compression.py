@@ -0,0 +1,175 @@
+"""
+Hash the decompressed content of gzip, bzip2 and xz inputs.
+
+Decompression runs in its own thread, feeding the hashers through a bounded
+queue, so decompressing and hashing overlap (zlib, bz2, lzma and hashlib all
+release the GIL). The raw compressed bytes may be hashed in the same pass, so
+both sets of digests come from a single read.
+"""
+
+import bz2
+import gzip
+import lzma
+from io import BufferedIOBase
+from os import PathLike
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from multihash import HasherType, MultiHash
+from multihash.memory import MIN_CHUNKSIZE, get_memory_budget
+
+#: Leading bytes identifying each supported compression format.
+MAGIC_NUMBERS = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+}
+
+_OPENERS: Dict[str, Callable[[Any], BufferedIOBase]] = {
+    "gzip": lambda stream: gzip.GzipFile(fileobj=stream, mode="rb"),
+    "bz2": bz2.BZ2File,
+    "xz": lzma.LZMAFile,
+}
+
+_DONE = object()
+
+
+def detect(header: bytes) -> Optional[str]:
+    """
+    Identify a compression format from the leading bytes of a file.
+
+    :param header: At least the first 6 bytes of the file
+    :returns: "gzip", "bz2", "xz", or None if the format isn't recognized
+    """
+    for compression, magic in MAGIC_NUMBERS.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+class _TeeReader:
+    """Wraps a stream, hashing everything read through it."""
+
+    def __init__(
+        self, stream: BinaryIO, multihash: Optional[MultiHash], prefix: bytes
+    ):
+        """Wrap a stream whose first bytes have already been read into prefix."""
+        self._stream = stream
+        self._multihash = multihash
+        self._prefix = prefix
+        self.mode = "rb"
+
+    def readable(self) -> bool:
+        """Report the stream is readable."""
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the stream, hashing what was read."""
+        if self._prefix:
+            if size < 0:
+                data = self._prefix + self._stream.read()
+            else:
+                data = self._prefix[:size]
+            self._prefix = self._prefix[len(data) :]
+        else:
+            data = self._stream.read(size)
+        if self._multihash is not None:
+            self._multihash.update(data)
+        return data
+
+
+def _produce(
+    reader: Union[BufferedIOBase, "_TeeReader"],
+    tee: _TeeReader,
+    chunksize: int,
+    queue: Queue,
+    stop: Event,
+) -> None:
+    """Decompress into the queue, then drain the raw stream so it's all hashed."""
+
+    def put(item: Any) -> None:
+        """Put an item on the queue, unless the consumer has gone away."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    try:
+        chunk = reader.read(chunksize)
+        while chunk and not stop.is_set():
+            put(chunk)
+            chunk = reader.read(chunksize)
+        while not stop.is_set() and tee.read(chunksize):
+            pass
+    except Exception as exc:  # pylint: disable=W0703
+        put(exc)
+    else:
+        put(_DONE)
+
+
+def hash_decompressed(
+    source: Union[str, PathLike, BinaryIO],
+    hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+    raw_hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+    compression: str = "auto",
+    chunksize: int = 8388608,  # 8MiB
+    queue_size: int = 2,
+) -> Tuple[MultiHash, Optional[MultiHash]]:
+    """
+    Hash the decompressed content of a compressed file or stream.
+
+    At most (queue_size + 2) * chunksize bytes of decompressed data are held
+    in RAM at once, reserved from the memory budget, so chunksize may shrink.
+    See `multihash.memory`.
+
+    :param source: A file path, or an object which implements .read()
+    :param hashers: Instances of classes conforming to the
+        hashlib.hash interface, or names of hashes appropriate for
+        `multihash.hashers.new()`, to hash the decompressed content with
+    :param raw_hashers: As hashers, to hash the compressed bytes with in the
+        same pass, or None to skip hashing them
+    :param compression: "gzip", "bz2", "xz", or "auto" to detect the format
+        from the leading bytes. Unrecognized inputs are hashed as they are.
+    :param chunksize: How many bytes to read into RAM at once
+    :param queue_size: How many decompressed chunks may wait to be hashed
+    :returns: The content MultiHash, and the raw MultiHash or None
+    """
+    if compression != "auto" and compression not in _OPENERS:
+        raise ValueError("Unsupported compression: {!r}".format(compression))
+    if isinstance(source, (str, PathLike)):
+        with open(source, "rb") as stream:
+            return hash_decompressed(
+                stream, hashers, raw_hashers, compression, chunksize, queue_size
+            )
+    content = MultiHash(hashers=hashers)
+    raw = MultiHash(hashers=raw_hashers) if raw_hashers is not None else None
+    header = source.read(max(len(magic) for magic in MAGIC_NUMBERS.values()))
+    detected = detect(header) if compression == "auto" else compression
+    tee = _TeeReader(source, raw, header)
+    reader = _OPENERS[detected](tee) if detected else tee
+
+    # Chunks waiting in the queue, plus one being read and one being hashed
+    buffers = queue_size + 2
+    budget = get_memory_budget()
+    with budget.reserve(chunksize * buffers, MIN_CHUNKSIZE * buffers) as reserved:
+        chunksize = reserved // buffers
+        queue: Queue = Queue(maxsize=queue_size)
+        stop = Event()
+        producer = Thread(
+            target=_produce, args=(reader, tee, chunksize, queue, stop), daemon=True
+        )
+        producer.start()
+        try:
+            item = queue.get()
+            while item is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                content.update(item)
+                item = queue.get()
+        finally:
+            stop.set()
+            producer.join()
+    return content, raw
@@ -0,0 +1,182 @@
+"""
+Answer hash requests from a long running process, over a Unix socket.
+
+When hashing small inputs, starting Python and importing modules takes
+longer than the hashing. A `HashDaemon` stays running with its hashers
+resolved and a pool of worker threads started, and `request()` is a thin
+client which forwards paths to it.
+
+Messages are newline delimited JSON, as in `multihash.distributed`. A client
+sends {"type": "hash", "paths": [...], "algos": [...], "chunksize": N} and
+receives {"type": "result", "results": {...}}, mapping each path to its
+hexdigests, or to {"error": message} if it couldn't be hashed. Paths are
+resolved by the client, so the daemon's working directory doesn't matter.
+"""
+
+import os
+import socket
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from multihash import MultiHash
+from multihash.distributed import make_server, receive_message, send_message
+from multihash.engine import hash_file
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers requests from a single connected client."""
+
+    server: Any
+
+    def handle(self) -> None:
+        """Answer requests until the client goes away."""
+        while True:
+            try:
+                message = receive_message(self.rfile)
+                if message is None:
+                    return
+                send_message(self.wfile, self.server.hash_daemon.answer(message))
+            except (OSError, ValueError):
+                return
+
+
+def _remove_stale(socket_path: str) -> None:
+    """Remove a socket file left behind by a daemon which is no longer running."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+    else:
+        raise OSError("A daemon is already listening on {}".format(socket_path))
+    finally:
+        probe.close()
+
+
+class HashDaemon:
+    """
+    Hashes files for clients connecting over a Unix socket.
+
+    Call `start()` to begin listening in the background, or `serve_forever()`.
+    """
+
+    def __init__(self, socket_path: str, workers: Optional[int] = None):
+        """
+        Create a new daemon.
+
+        :param socket_path: The path of the Unix socket to listen on
+        :param workers: How many files to hash at once, defaults to the
+            ThreadPoolExecutor default
+        """
+        self.socket_path = socket_path
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._prototypes: Dict[Optional[Tuple[str, ...]], MultiHash] = {}
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def _prototype(self, algos: Optional[List[str]]) -> MultiHash:
+        """Return resolved hashers for some algorithm names, cached."""
+        key = tuple(algos) if algos is not None else None
+        if key not in self._prototypes:
+            self._prototypes[key] = MultiHash(hashers=algos)
+        return self._prototypes[key]
+
+    def answer(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the reply to a request."""
+        if message.get("type") != "hash":
+            error = "Unknown message type: {!r}".format(message.get("type"))
+            return {"type": "error", "message": error}
+        try:
+            prototype = self._prototype(message.get("algos"))
+        except ValueError as exc:
+            return {"type": "error", "message": str(exc)}
+        chunksize = message.get("chunksize") or 128000000  # 128MB
+        futures = [
+            (path, self._executor.submit(hash_file, path, prototype, chunksize))
+            for path in message.get("paths", [])
+        ]
+        results: Dict[str, Any] = {}
+        for path, future in futures:
+            try:
+                results[path] = future.result().hexdigest()
+            except Exception as exc:  # pylint: disable=W0703
+                results[path] = {"error": "{}: {}".format(type(exc).__name__, exc)}
+        return {"type": "result", "results": results}
+
+    def _bind(self) -> socketserver.BaseServer:
+        """Bind the socket, replacing a stale one."""
+        _remove_stale(self.socket_path)
+        self._server = make_server("unix:" + self.socket_path, _Handler)
+        self._server.hash_daemon = self  # type: ignore
+        return self._server
+
+    def start(self) -> None:
+        """Start listening for clients in a background thread."""
+        Thread(target=self._bind().serve_forever, daemon=True).start()
+
+    def serve_forever(self) -> None:
+        """Listen for clients until interrupted."""
+        server = self._bind()
+        try:
+            server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop listening, and stop the worker threads."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        self._executor.shutdown()
+
+    def __enter__(self) -> "HashDaemon":
+        """Start listening."""
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Stop listening."""
+        self.close()
+
+
+def request(
+    socket_path: str,
+    filepaths: Iterable[str],
+    algos: Optional[Iterable[str]] = None,
+    chunksize: int = 128000000,  # 128MB
+) -> Dict[str, Any]:
+    """
+    Ask a daemon to hash some files.
+
+    :param socket_path: The path of the daemon's Unix socket
+    :param filepaths: The files to hash
+    :param algos: Names of hashes appropriate for `multihash.hashers.new()`
+    :param chunksize: How many bytes the daemon reads into RAM at once
+    :returns: Each path's hexdigests, or {"error": message}
+    """
+    filepaths = list(filepaths)
+    resolved = [os.path.abspath(path) for path in filepaths]
+    message = {
+        "type": "hash",
+        "paths": resolved,
+        "algos": list(algos) if algos is not None else None,
+        "chunksize": chunksize,
+    }
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            send_message(stream, message)
+            reply = receive_message(stream)
+    if reply is None:
+        raise ConnectionError("The daemon closed the connection")
+    if reply.get("type") != "result":
+        raise ValueError(reply.get("message", "Unknown error"))
+    results = reply["results"]
+    return {path: results[absolute] for path, absolute in zip(filepaths, resolved)}
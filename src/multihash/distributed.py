@@ -0,0 +1,395 @@
+"""
+Distribute hashing across worker processes, on any number of hosts.
+
+A `Coordinator` hands out work units (whole files, or byte ranges of them)
+to workers over TCP or a Unix socket, retries units whose worker failed or
+disconnected, and merges the results into a single manifest. Workers, see
+`run_worker()`, hash each unit with `MultiHash.from_filepath()`, so every
+worker must see the inputs at the same paths, eg: on a shared filesystem.
+
+The protocol is newline delimited JSON. A worker sends {"type": "hello"},
+then the coordinator sends {"type": "work", ...} messages, each answered
+with {"type": "result", "digests": ...} or {"type": "error", "message": ...},
+until it sends {"type": "done"}.
+
+Addresses are "HOST:PORT" for TCP, or "unix:PATH" for a Unix socket.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import time
+from io import BufferedIOBase
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from typing import Any, BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Union
+
+from multihash import MultiHash
+
+_UNIX_PREFIX = "unix:"
+
+# Socket files, from socket.makefile() or a socketserver handler
+_Stream = Union[BinaryIO, BufferedIOBase]
+
+
+class WorkUnit(NamedTuple):
+    """A file, or a byte range of one, to hash."""
+
+    path: str
+    offset: int = 0
+    length: Optional[int] = None
+
+
+def parse_address(address: str) -> Union[str, tuple]:
+    """
+    Parse a "HOST:PORT" or "unix:PATH" address.
+
+    :param address: The address
+    :returns: A path for Unix sockets, or a (host, port) tuple for TCP
+    """
+    if address.startswith(_UNIX_PREFIX):
+        return address[len(_UNIX_PREFIX) :]
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError("Invalid address: {!r}".format(address))
+    return (host.strip("[]") or "localhost", int(port))
+
+
+def send_message(stream: _Stream, message: Dict[str, Any]) -> None:
+    """Write a message to a socket file."""
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def receive_message(stream: _Stream) -> Optional[Dict[str, Any]]:
+    """Read a message from a socket file, returning None once it's closed."""
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def plan(filepaths: Iterable[str], split_size: Optional[int] = None) -> List[WorkUnit]:
+    """
+    Divide files into work units.
+
+    :param filepaths: The files to hash
+    :param split_size: Split files larger than this many bytes into byte
+        ranges of this size, None keeps files whole
+    """
+    units = []
+    for path in filepaths:
+        try:
+            size = os.stat(path).st_size if split_size else 0
+        except OSError:
+            size = 0  # Let a worker report the error
+        if not split_size or size <= split_size:
+            units.append(WorkUnit(path))
+            continue
+        units.extend(
+            WorkUnit(path, offset, min(split_size, size - offset))
+            for offset in range(0, size, split_size)
+        )
+    return units
+
+
+def _valid_reply(reply: Any) -> bool:
+    """Check a worker's reply is a result with digests, or an error."""
+    if not isinstance(reply, dict):
+        return False
+    if reply.get("type") == "result":
+        return isinstance(reply.get("digests"), dict)
+    return reply.get("type") == "error"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serves work units to a single connected worker."""
+
+    server: Any
+
+    def handle(self) -> None:
+        """Hand out units until there are none left, or the worker goes away."""
+        coordinator = self.server.coordinator
+        self.request.settimeout(coordinator.timeout)
+        try:
+            if receive_message(self.rfile) is None:
+                return
+        except (OSError, ValueError):
+            return
+        while True:
+            unit = coordinator._next_unit()
+            if unit is None:
+                try:
+                    send_message(self.wfile, {"type": "done"})
+                except OSError:
+                    pass
+                return
+            try:
+                send_message(self.wfile, coordinator._work_message(unit))
+                reply = receive_message(self.rfile)
+            except (OSError, ValueError) as exc:
+                coordinator._retry(unit, "Worker connection failed: {}".format(exc))
+                return
+            if reply is None:
+                coordinator._retry(unit, "Worker disconnected")
+                return
+            if not _valid_reply(reply):
+                coordinator._retry(unit, "Invalid reply: {!r}".format(reply))
+                return
+            if reply["type"] == "result":
+                coordinator._complete(unit, reply["digests"])
+            else:
+                coordinator._retry(unit, str(reply.get("message", "Unknown error")))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    """A threaded TCP server."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):  # type: ignore
+        """A threaded Unix socket server."""
+
+        daemon_threads = True
+
+
+def make_server(address: str, handler: Any) -> socketserver.BaseServer:
+    """
+    Bind a threaded server for a "HOST:PORT" or "unix:PATH" address.
+
+    :param address: The address to listen on
+    :param handler: The request handler class
+    """
+    parsed = parse_address(address)
+    if isinstance(parsed, str):
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):  # pragma: no cover
+            raise ValueError("Unix sockets aren't supported on this platform")
+        return _UnixServer(parsed, handler)
+    return _TCPServer(parsed, handler)
+
+
+class Coordinator:
+    """
+    Hands out work units to workers and collects their results.
+
+    Call `start()` to begin listening, then `wait()` for the manifest, or
+    just call `run()` to do both.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        filepaths: Iterable[str],
+        algos: Optional[Iterable[str]] = None,
+        chunksize: int = 128000000,  # 128MB
+        split_size: Optional[int] = None,
+        max_attempts: int = 3,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Create a new coordinator.
+
+        :param address: The address to listen on, a port of 0 picks a free one
+        :param filepaths: The files to hash
+        :param algos: Names of hashes appropriate for `multihash.hashers.new()`
+        :param chunksize: How many bytes workers read into RAM at once
+        :param split_size: Split files larger than this many bytes into byte
+            ranges of this size, None keeps files whole
+        :param max_attempts: How many times a unit is tried before giving up
+        :param timeout: How many seconds to wait for a worker's reply before
+            retrying the unit elsewhere, None waits forever
+        """
+        self.address = address
+        self.algos = list(algos) if algos is not None else None
+        self.chunksize = chunksize
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._units = plan(filepaths, split_size)
+        self._queue: Queue = Queue()
+        for unit in self._units:
+            self._queue.put(unit)
+        self._attempts: Dict[WorkUnit, int] = dict.fromkeys(self._units, 0)
+        self._results: Dict[WorkUnit, Dict[str, Any]] = {}
+        self._remaining = len(self._units)
+        self._lock = Lock()
+        self._finished = Event()
+        if not self._units:
+            self._finished.set()
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def start(self) -> str:
+        """
+        Start listening for workers in a background thread.
+
+        :returns: The address workers should connect to
+        """
+        self._server = make_server(self.address, _Handler)
+        self._server.coordinator = self  # type: ignore
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        bound = self._server.server_address
+        if isinstance(bound, tuple):
+            self.address = "{}:{}".format(bound[0], bound[1])
+        return self.address
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Wait for every unit to finish, then stop listening.
+
+        :param timeout: How many seconds to wait, None waits forever
+        :returns: The manifest, see `manifest()`
+        """
+        if not self._finished.wait(timeout):
+            raise TimeoutError("Work units are still outstanding")
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if isinstance(self._server.server_address, str):
+                os.unlink(self._server.server_address)
+        return self.manifest()
+
+    def run(self) -> Dict[str, Any]:
+        """Start listening, and wait for the manifest."""
+        self.start()
+        return self.wait()
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Merge the results into a manifest.
+
+        Whole files map to their hexdigests, or {"error": message} if they
+        couldn't be hashed. Split files map to a list of ranges, each with an
+        "offset", a "length" and the "digests" or an "error".
+        """
+        manifest: Dict[str, Any] = {}
+        for unit in self._units:
+            result = self._results.get(unit, {"error": "Not hashed"})
+            if unit.length is None:
+                manifest[unit.path] = result
+                continue
+            entry: Dict[str, Any] = {"offset": unit.offset, "length": unit.length}
+            if "error" in result:
+                entry["error"] = result["error"]
+            else:
+                entry["digests"] = result
+            manifest.setdefault(unit.path, []).append(entry)
+        return manifest
+
+    def _work_message(self, unit: WorkUnit) -> Dict[str, Any]:
+        """Build the message asking a worker to hash a unit."""
+        return {
+            "type": "work",
+            "path": unit.path,
+            "offset": unit.offset,
+            "length": unit.length,
+            "algos": self.algos,
+            "chunksize": self.chunksize,
+        }
+
+    def _next_unit(self) -> Optional[WorkUnit]:
+        """Wait for a unit to hand out, returning None once all are finished."""
+        while not self._finished.is_set():
+            try:
+                return self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return None
+
+    def _finish_unit(self, unit: WorkUnit, result: Dict[str, Any]) -> None:
+        """Record a unit's final result."""
+        with self._lock:
+            self._results[unit] = result
+            self._remaining -= 1
+            if not self._remaining:
+                self._finished.set()
+
+    def _complete(self, unit: WorkUnit, digests: Dict[str, str]) -> None:
+        """Record a successfully hashed unit."""
+        self._finish_unit(unit, digests)
+
+    def _retry(self, unit: WorkUnit, message: str) -> None:
+        """Requeue a failed unit, or record its failure once out of attempts."""
+        with self._lock:
+            self._attempts[unit] += 1
+            exhausted = self._attempts[unit] >= self.max_attempts
+        if exhausted:
+            self._finish_unit(unit, {"error": message})
+        else:
+            self._queue.put(unit)
+
+
+def _connect(address: str, attempts: int, retry_interval: float) -> socket.socket:
+    """Connect to a coordinator, retrying while it starts up."""
+    parsed = parse_address(address)
+    for attempt in range(attempts):
+        try:
+            if isinstance(parsed, str):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(parsed)
+                return sock
+            return socket.create_connection(parsed)
+        except OSError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(retry_interval)
+    raise ValueError("attempts must be positive")
+
+
+def _hash_unit(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Hash the unit in a work message, returning the reply."""
+    try:
+        digests = MultiHash.from_filepath(
+            message["path"],
+            hashers=message["algos"],
+            chunksize=message["chunksize"],
+            offset=message["offset"],
+            length=message["length"],
+        ).hexdigest()
+    except Exception as exc:  # pylint: disable=W0703
+        error = "{}: {}".format(type(exc).__name__, exc)
+        return {"type": "error", "message": error}
+    return {"type": "result", "digests": digests}
+
+
+def run_worker(
+    address: str, connect_attempts: int = 10, retry_interval: float = 1.0
+) -> int:
+    """
+    Connect to a coordinator and hash work units until it's done.
+
+    If the coordinator drops the connection, eg: after a timeout, the worker
+    reconnects, and only returns once told it's done or it isn't listening.
+
+    :param address: The coordinator's address
+    :param connect_attempts: How many times to try connecting
+    :param retry_interval: How many seconds to wait between connection attempts
+    :returns: How many units this worker hashed
+    """
+    hashed = 0
+    sock = _connect(address, connect_attempts, retry_interval)
+    while True:
+        done = False
+        try:
+            with sock, sock.makefile("rwb") as stream:
+                send_message(stream, {"type": "hello", "pid": os.getpid()})
+                message = receive_message(stream)
+                while message is not None and message.get("type") == "work":
+                    reply = _hash_unit(message)
+                    hashed += reply["type"] == "result"
+                    send_message(stream, reply)
+                    message = receive_message(stream)
+                done = message is not None
+        except ConnectionError:
+            pass
+        if done:
+            return hashed
+        # The coordinator dropped the connection, eg: after a timeout, or it
+        # finished without saying so. If it's still listening, carry on.
+        try:
+            sock = _connect(address, 1, retry_interval)
+        except OSError:
+            return hashed
@@ -0,0 +1,204 @@
+"""
+Hash many files, with a fast path for small ones.
+
+For trees of small files, per-file overhead dominates: creating a buffered
+file object, repeated reads and resolving hasher names. Here small files
+are read with `os.open`, `os.fstat` and a single `os.read`, hashers are
+resolved once and copied for each file, and files are hashed across worker
+threads so their open and stat latency overlaps, which matters most on
+network filesystems. Pipes, FIFOs and other files which aren't regular,
+eg: /dev/stdin, are read sequentially instead. Large files hashed only with
+piece hashers, eg: treehash, have their pieces digested in parallel, see
+`multihash.hashers.update_in_parallel()`.
+
+When files are spread across several disks or mounts, the number of files
+hashed at once on each device (`os.stat().st_dev`) may be limited, with
+devices taking turns, so one volume isn't thrashed with seeks while the
+others sit idle.
+"""
+
+import os
+import stat
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from os import PathLike
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from multihash import HasherType, MultiHash
+from multihash.hashers import update_in_parallel
+from multihash.memory import MIN_CHUNKSIZE, get_memory_budget
+from multihash.parallel import iter_range
+
+#: Files up to this many bytes are read with a single read.
+SMALL_FILE_SIZE = 65536  # 64KiB
+# Pipes rarely return more than this from a single read
+_STREAM_CHUNKSIZE = 1048576  # 1MiB
+
+
+def _hash_unsized(fd: int, multihash: MultiHash, chunksize: int) -> None:
+    """Hash a file which can't be sized or seeked, eg: a pipe, to its end."""
+    with get_memory_budget().reserve(chunksize, MIN_CHUNKSIZE) as chunksize:
+        chunk = os.read(fd, chunksize)
+        while chunk:
+            multihash.update(chunk)
+            chunk = os.read(fd, chunksize)
+
+
+def hash_file(
+    filepath: Union[str, PathLike],
+    prototype: MultiHash,
+    chunksize: int = 128000000,  # 128MB
+    small_file_size: int = SMALL_FILE_SIZE,
+) -> MultiHash:
+    """
+    Hash a file with fresh copies of a prototype's hashers.
+
+    :param filepath: A file path
+    :param prototype: A MultiHash whose hashers are copied, and never updated
+    :param chunksize: How many bytes to read into RAM at once, for large files,
+        at most. See `multihash.memory`.
+    :param small_file_size: Files up to this many bytes are read at once
+    """
+    multihash = MultiHash(hashers=prototype.copy().values())
+    fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        status = os.fstat(fd)
+        if not stat.S_ISREG(status.st_mode):
+            _hash_unsized(fd, multihash, min(chunksize, _STREAM_CHUNKSIZE))
+            return multihash
+        size = status.st_size
+        offset = 0
+        if size <= small_file_size:
+            # Hashers get bytes of their own, which they're free to keep
+            data = os.read(fd, small_file_size)
+            offset = len(data)
+            multihash.update(data)
+            if offset == size:
+                return multihash
+        elif update_in_parallel(multihash.hashers, filepath, chunksize):
+            return multihash
+        # Large files, and small files which grew or were short read
+        wanted = min(chunksize, max(size - offset, MIN_CHUNKSIZE))
+        with get_memory_budget().reserve(wanted, MIN_CHUNKSIZE) as chunksize:
+            for chunk in iter_range(fd, offset, None, chunksize):
+                multihash.update(chunk)
+    finally:
+        os.close(fd)
+    return multihash
+
+
+def _device(filepath: Union[str, PathLike]) -> Optional[int]:
+    """Return the device a file is on, or None if it can't be stat'd."""
+    try:
+        return os.stat(filepath).st_dev
+    except OSError:
+        return None  # Let hashing the file report the error
+
+
+def _hash_by_device(  # pylint: disable=R0913,R0914
+    filepaths: Iterable[Union[str, PathLike]],
+    prototype: MultiHash,
+    chunksize: int,
+    max_workers: int,
+    per_device: int,
+    small_file_size: int,
+) -> Iterator[Tuple[Union[str, PathLike], MultiHash]]:
+    """Hash files on a pool of threads, limiting and rotating between devices."""
+    paths = list(filepaths)
+    pending: Dict[Optional[int], Deque[int]] = {}
+    for index, filepath in enumerate(paths):
+        pending.setdefault(_device(filepath), deque()).append(index)
+    # Devices with files left to submit, in the order they take turns
+    devices = deque(pending)
+    active: Counter = Counter()
+    running: Dict[Future, Tuple[int, Optional[int]]] = {}
+    done: Dict[int, Future] = {}
+    next_index = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while next_index < len(paths):
+            submitted = True
+            while submitted and devices and len(running) < max_workers:
+                submitted = False
+                for _ in range(len(devices)):
+                    if len(running) >= max_workers:
+                        break
+                    device = devices.popleft()
+                    if active[device] < per_device:
+                        index = pending[device].popleft()
+                        future = executor.submit(
+                            hash_file,
+                            paths[index],
+                            prototype,
+                            chunksize,
+                            small_file_size,
+                        )
+                        running[future] = (index, device)
+                        active[device] += 1
+                        submitted = True
+                    if pending[device]:
+                        devices.append(device)
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, device = running.pop(future)
+                active[device] -= 1
+                done[index] = future
+            while next_index in done:
+                yield paths[next_index], done.pop(next_index).result()
+                next_index += 1
+
+
+def hash_files(  # pylint: disable=R0913
+    filepaths: Iterable[Union[str, PathLike]],
+    hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+    chunksize: int = 128000000,  # 128MB
+    max_workers: int = 1,
+    small_file_size: int = SMALL_FILE_SIZE,
+    per_device: Optional[int] = None,
+) -> Iterator[Tuple[Union[str, PathLike], MultiHash]]:
+    """
+    Hash many files, yielding each path and its MultiHash in the given order.
+
+    Hasher instances are copied for every file, so they must be safe to copy
+    from several threads; process backed hashers are not.
+
+    :param filepaths: The file paths to hash
+    :param hashers: Instances of classes conforming to the
+        hashlib.hash interface, or names of hashes appropriate for
+        `multihash.hashers.new()`
+    :param chunksize: How many bytes each worker reads into RAM at once
+    :param max_workers: How many files to hash at once
+    :param small_file_size: Files up to this many bytes are read at once
+    :param per_device: How many files to hash at once on each device, with
+        devices taking turns, None for no limit. Every path is stat'd up
+        front to find its device.
+    """
+    prototype = MultiHash(hashers=hashers)
+    if max_workers > 1 and per_device is not None:
+        if per_device < 1:
+            raise ValueError("per_device must be positive")
+        yield from _hash_by_device(
+            filepaths, prototype, chunksize, max_workers, per_device, small_file_size
+        )
+        return
+    if max_workers <= 1:
+        for filepath in filepaths:
+            yield filepath, hash_file(filepath, prototype, chunksize, small_file_size)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # A bounded window of submissions keeps memory flat for huge trees.
+        window: Deque = deque()
+        for filepath in filepaths:
+            window.append(
+                (
+                    filepath,
+                    executor.submit(
+                        hash_file, filepath, prototype, chunksize, small_file_size
+                    ),
+                )
+            )
+            if len(window) >= max_workers * 4:
+                done_path, future = window.popleft()
+                yield done_path, future.result()
+        while window:
+            done_path, future = window.popleft()
+            yield done_path, future.result()
@@ -0,0 +1,219 @@
+"""
+A long lived service for hashing many submissions concurrently.
+
+A `MultiHashExecutor` hashes submitted streams, file paths and buffers on a
+fixed pool of threads, returning `concurrent.futures.Future` objects of
+`MultiHash` results. Unlike an ad-hoc thread pool, it bounds how many
+submissions may wait (submitting blocks when the queue is full), bounds how
+many bytes are buffered across every hash in progress, and runs waiting
+submissions in priority order.
+
+Each submission reserves its bytes from a `multihash.memory.MemoryBudget`
+when it's submitted: a buffer its size, and a stream or file one chunk,
+which is all it reads into RAM at once, shrunk if the budget is short.
+Workers never wait on the budget, so they can't deadlock on it, and
+submitting is where the backpressure is felt. Pass
+`multihash.memory.get_memory_budget()` to share the process wide budget.
+"""
+
+import os
+from concurrent.futures import Future
+from itertools import count
+from os import PathLike
+from queue import Empty, PriorityQueue
+from threading import Lock, Thread
+from typing import Any, BinaryIO, Iterable, List, Optional, Tuple, Union
+
+from multihash import HasherType, MultiHash
+from multihash.buffers import iter_buffer
+from multihash.memory import MIN_CHUNKSIZE, MemoryBudget
+
+#: Priorities for common lanes, lower priorities run first.
+HIGH, NORMAL, LOW = -10, 0, 10
+
+# Sorts after every submission, so workers only stop once the queue drains
+_STOP = float("inf")
+
+
+class MultiHashExecutor:
+    """Hashes submissions on a pool of threads, within a byte budget."""
+
+    def __init__(
+        self,
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        max_workers: int = 4,
+        max_queued: int = 64,
+        max_inflight_bytes: int = 268435456,  # 256MiB
+        chunksize: int = 8388608,  # 8MiB
+        budget: Optional[MemoryBudget] = None,
+    ):
+        """
+        Create a new executor, and start its threads.
+
+        :param hashers: Instances of classes conforming to the
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`, copied for each submission
+        :param max_workers: How many submissions to hash at once
+        :param max_queued: How many submissions may wait to be hashed before
+            submitting blocks
+        :param max_inflight_bytes: How many bytes may be reserved at once,
+            across every submission being hashed or waiting
+        :param chunksize: How many bytes to read into RAM at once, for each
+            stream or file
+        :param budget: The budget to reserve bytes from, rather than a new
+            one of max_inflight_bytes
+        """
+        self.chunksize = chunksize
+        self._prototype = MultiHash(hashers=hashers)
+        if budget is None:
+            budget = MemoryBudget(max_inflight_bytes)
+        self._budget = budget
+        self._queue: PriorityQueue = PriorityQueue(maxsize=max_queued)
+        self._sequence = count()
+        self._lock = Lock()
+        self._shutdown = False
+        self._threads: List[Thread] = []
+        for _ in range(max_workers):
+            thread = Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def inflight_bytes(self) -> int:
+        """How many bytes are currently reserved by submissions."""
+        return self._budget.used
+
+    def submit(
+        self,
+        source: Union[str, PathLike, BinaryIO, Any],
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        priority: int = NORMAL,
+        timeout: Optional[float] = None,
+    ) -> "Future[MultiHash]":
+        """
+        Submit something to hash, waiting while the queue is full.
+
+        :param source: A file path, an object which implements .read(), or
+            an object supporting the buffer protocol, eg: bytes
+        :param hashers: Hashers for this submission, rather than the
+            executor's. Instances are used directly, so mustn't be shared.
+        :param priority: Lower priorities run first, see HIGH, NORMAL and LOW
+        :param timeout: How many seconds to wait for room in the queue, or
+            the byte budget, None waits forever
+        :raises queue.Full: If the queue stayed full for timeout seconds
+        :raises TimeoutError: If there wasn't room in the byte budget within
+            timeout seconds
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown")
+        size, minimum = self._reservation(source)
+        reserved = self._budget.acquire(size, minimum, timeout)
+        future: "Future[MultiHash]" = Future()
+        try:
+            self._queue.put(
+                (priority, next(self._sequence), source, hashers, reserved, future),
+                timeout=timeout,
+            )
+        except BaseException:
+            self._budget.release(reserved)
+            raise
+        return future
+
+    def _reservation(self, source: Any) -> Tuple[int, int]:
+        """Return how many bytes a submission may buffer, and may settle for."""
+        minimum = min(self.chunksize, MIN_CHUNKSIZE)
+        if isinstance(source, (str, PathLike)):
+            try:
+                size = os.stat(source).st_size
+            except OSError:
+                return 0, 0  # Let the worker report the error
+            # Small files don't need a whole chunk, but may grow a little
+            return min(self.chunksize, max(size, MIN_CHUNKSIZE)), minimum
+        if hasattr(source, "read"):
+            return self.chunksize, minimum
+        size = memoryview(source).nbytes
+        return size, size
+
+    def _new_multihash(
+        self, hashers: Optional[Iterable[Union[HasherType, str]]]
+    ) -> MultiHash:
+        """Return a MultiHash for a submission."""
+        if hashers is not None:
+            return MultiHash(hashers=hashers)
+        return MultiHash(hashers=self._prototype.copy().values())
+
+    @staticmethod
+    def _hash_stream(stream: BinaryIO, multihash: MultiHash, chunksize: int) -> None:
+        """Hash a stream, chunksize bytes at a time."""
+        chunk = stream.read(chunksize)
+        while chunk:
+            multihash.update(chunk)
+            chunk = stream.read(chunksize)
+
+    def _hash(
+        self,
+        source: Any,
+        hashers: Optional[Iterable[Union[HasherType, str]]],
+        reserved: int,
+    ) -> MultiHash:
+        """Hash a submission, buffering at most the bytes it reserved."""
+        multihash = self._new_multihash(hashers)
+        if isinstance(source, (str, PathLike)):
+            with open(source, "rb", buffering=0) as stream:
+                self._hash_stream(stream, multihash, reserved)
+        elif hasattr(source, "read"):
+            self._hash_stream(source, multihash, reserved)
+        else:
+            for chunk in iter_buffer(source, self.chunksize):
+                multihash.update(chunk)
+        return multihash
+
+    def _work(self) -> None:
+        """Hash submissions until told to stop."""
+        while True:
+            priority, _, source, hashers, reserved, future = self._queue.get()
+            if priority == _STOP:
+                return
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._hash(source, hashers, reserved))
+                except Exception as exc:  # pylint: disable=W0703
+                    future.set_exception(exc)
+            finally:
+                self._budget.release(reserved)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        """
+        Stop accepting submissions, and stop the threads once the queue drains.
+
+        :param wait: Wait for the threads to finish
+        :param cancel_futures: Cancel waiting submissions, rather than
+            hashing them
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        while cancel_futures:
+            try:
+                _, _, _, _, reserved, future = self._queue.get_nowait()
+            except Empty:
+                break
+            future.cancel()
+            self._budget.release(reserved)
+        for _ in self._threads:
+            self._queue.put((_STOP, next(self._sequence), None, None, 0, None))
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self) -> "MultiHashExecutor":
+        """Use the executor as a context manager."""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Shut down, waiting for every submission to be hashed."""
+        self.shutdown()
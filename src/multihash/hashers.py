@@ -0,0 +1,541 @@
+"""
+Additional hashers, and the registry used to resolve hasher names.
+
+Everything here conforms to the `HasherType` protocol, so instances may be
+handed to `MultiHash` alongside hashlib hashers, or requested by name.
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from functools import lru_cache
+from importlib import import_module
+from os import PathLike
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Union,
+)
+
+from multihash.parallel import hash_ranges, iter_range
+
+if TYPE_CHECKING:  # pragma: no cover
+    from multihash import HasherType
+
+_SIZE_PATTERN = re.compile(r"^\s*(\d+)\s*([kmgt]?)(i?)(b?)\s*$", re.IGNORECASE)
+_SIZE_UNITS = "kmgt"
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a human readable size, eg: "8MiB", into a number of bytes.
+
+    Binary suffixes (KiB, MiB, ...) and bare suffixes (K, M, ...) are powers
+    of 1024, decimal suffixes (KB, MB, ...) are powers of 1000.
+
+    :param size: The size to parse
+    """
+    match = _SIZE_PATTERN.match(size)
+    if match is None:
+        raise ValueError("Invalid size: {!r}".format(size))
+    number, unit, binary, byte = match.groups()
+    if not unit:
+        if binary:
+            raise ValueError("Invalid size: {!r}".format(size))
+        return int(number)
+    base = 1000 if byte and not binary else 1024
+    return int(number) * base ** (_SIZE_UNITS.index(unit.lower()) + 1)
+
+
+def format_size(size: int) -> str:
+    """
+    Format a number of bytes using the largest binary suffix that divides it.
+
+    :param size: The number of bytes
+    """
+    for power in range(len(_SIZE_UNITS), 0, -1):
+        if size and size % 1024 ** power == 0:
+            unit = _SIZE_UNITS[power - 1].upper()
+            return "{}{}iB".format(size // 1024 ** power, unit)
+    return str(size)
+
+
+class _HashlibFactory:  # pylint: disable=R0903
+    """A picklable factory for hashlib hashers, so process pools can use it."""
+
+    def __init__(self, name: str):
+        """Store the name of the algorithm."""
+        self.name = name
+
+    def __call__(self, data: bytes = b"") -> "HasherType":
+        """Return a hasher."""
+        return hashlib.new(self.name, data)
+
+
+class PieceHasher:
+    """
+    Base class for hashers which digest fixed size pieces of their input.
+
+    Subclasses provide a name and combine the per-piece digests into a
+    final digest by implementing `_combine()`. Because pieces are independent,
+    the pieces of a file on disk may be digested in parallel, see
+    `from_filepath()` and `update_in_parallel()`.
+    """
+
+    name = "pieces"
+    digest_size = 0
+    block_size = 0
+
+    def __init__(
+        self, piece_size: int, piece_factory: Callable = hashlib.md5, data: bytes = b""
+    ):
+        """
+        Create a new piece hasher.
+
+        :param piece_size: The size of each piece, in bytes
+        :param piece_factory: A callable returning a fresh hasher for each piece
+        :param data: Binary data to seed the hasher with
+        """
+        if piece_size <= 0:
+            raise ValueError("piece_size must be positive")
+        self.piece_size = piece_size
+        self._piece_factory = piece_factory
+        self._pieces: List[bytes] = []
+        self._current = piece_factory()
+        self._current_size = 0
+        if data:
+            self.update(data)
+
+    @classmethod
+    def from_filepath(
+        cls,
+        filepath: Union[str, PathLike],
+        *args,
+        max_workers: Optional[int] = None,
+        use_processes: bool = False,
+        chunksize: int = 8388608,  # 8MiB
+        **kwargs,
+    ) -> "PieceHasher":
+        """
+        Instantiate a new hasher and digest the pieces of a file in parallel.
+
+        :param filepath: A file path
+        :param max_workers: How many pieces to digest at once, defaults to the
+            number of CPUs
+        :param use_processes: Use a process pool rather than a thread pool
+        :param chunksize: How many bytes each worker reads into RAM at once
+
+        Any other arguments are passed to the constructor.
+        """
+        hasher = cls(*args, **kwargs)
+        hasher.update_from_filepath(
+            filepath,
+            max_workers=max_workers,
+            use_processes=use_processes,
+            chunksize=chunksize,
+        )
+        return hasher
+
+    def update_from_filepath(
+        self,
+        filepath: Union[str, PathLike],
+        max_workers: Optional[int] = None,
+        use_processes: bool = False,
+        chunksize: int = 8388608,  # 8MiB
+    ) -> None:
+        """
+        Update the hasher with a file, digesting its pieces in parallel.
+
+        The hasher must be at a piece boundary, eg: fresh, so the file's
+        pieces line up with the hasher's.
+
+        :param filepath: A file path
+        :param max_workers: How many pieces to digest at once, defaults to the
+            number of CPUs
+        :param use_processes: Use a process pool rather than a thread pool
+        :param chunksize: How many bytes each worker reads into RAM at once
+        """
+        if self._current_size:
+            raise ValueError("The hasher isn't at a piece boundary")
+        size = os.stat(filepath).st_size
+        full_pieces = size // self.piece_size
+        self._pieces.extend(
+            hash_ranges(
+                filepath,
+                [(i * self.piece_size, self.piece_size) for i in range(full_pieces)],
+                self._piece_factory,
+                max_workers=max_workers,
+                use_processes=use_processes,
+                chunksize=min(chunksize, self.piece_size),
+            )
+        )
+        # The trailing partial piece stays live, so the hasher may be updated.
+        tail = full_pieces * self.piece_size
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            for chunk in iter_range(fd, tail, None, chunksize):
+                self.update(chunk)
+        finally:
+            os.close(fd)
+
+    def update(self, data: Union[bytes, memoryview]) -> None:
+        """Update the hasher, splitting the data across piece boundaries."""
+        view = memoryview(data).cast("B")
+        while view:
+            taken = view[: self.piece_size - self._current_size]
+            self._current.update(taken)
+            self._current_size += len(taken)
+            view = view[len(taken) :]
+            if self._current_size == self.piece_size:
+                self._pieces.append(self._current.digest())
+                self._current = self._piece_factory()
+                self._current_size = 0
+
+    def piece_digests(self) -> List[bytes]:
+        """Return the digest of every piece so far, including a partial last one."""
+        if self._current_size:
+            return self._pieces + [self._current.digest()]
+        return list(self._pieces)
+
+    def _combine(self, pieces: List[bytes]) -> bytes:
+        """Combine the piece digests into the final digest."""
+        raise NotImplementedError
+
+    def digest(self) -> bytes:
+        """Produce a digest."""
+        return self._combine(self.piece_digests())
+
+    def hexdigest(self) -> str:
+        """Produce a hexdigest."""
+        return self.digest().hex()
+
+    def copy(self) -> "PieceHasher":
+        """Produce a copy of the hasher."""
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._pieces = list(self._pieces)
+        clone._current = self._current.copy()
+        return clone
+
+
+class S3ETag(PieceHasher):
+    """
+    Computes S3 style multipart upload ETags.
+
+    A multipart ETag is the MD5 of the concatenated MD5s of each part, followed
+    by "-" and the number of parts. Inputs no larger than a single part
+    produce the plain MD5, as a single part upload would.
+
+    `digest()` returns the raw MD5 bytes, `hexdigest()` returns the ETag.
+    """
+
+    digest_size = 16
+    block_size = 64
+
+    def __init__(self, part_size: int = 8388608, data: bytes = b""):  # 8MiB
+        """
+        Create a new S3 ETag hasher.
+
+        :param part_size: The multipart upload part size, in bytes
+        :param data: Binary data to seed the hasher with
+        """
+        super().__init__(part_size, piece_factory=hashlib.md5, data=data)
+        self.name = "s3etag:{}".format(format_size(part_size))
+
+    def _combine(self, pieces: List[bytes]) -> bytes:
+        """Combine the part MD5s."""
+        if not pieces:
+            return hashlib.md5().digest()  # nosec
+        if len(pieces) == 1:
+            return pieces[0]
+        return hashlib.md5(b"".join(pieces)).digest()  # nosec
+
+    def hexdigest(self) -> str:
+        """Produce the ETag."""
+        parts = len(self.piece_digests())
+        if parts <= 1:
+            return self.digest().hex()
+        return "{}-{}".format(self.digest().hex(), parts)
+
+
+class TreeHash(PieceHasher):
+    """
+    Computes Merkle tree hashes over fixed size leaves.
+
+    Each leaf is digested on its own, then adjacent digests are concatenated
+    and digested pairwise until a single root digest remains. An odd digest
+    out at any level is promoted to the next level unchanged. With the
+    defaults this is the Amazon Glacier SHA256 tree hash.
+
+    `digest()` returns the root, `piece_digests()` returns the leaf digests.
+    With `algorithm="sha1"` and a `leaf_size` of the torrent's piece length,
+    the concatenated leaf digests are the BitTorrent v1 "pieces" field.
+    """
+
+    def __init__(
+        self,
+        leaf_size: int = 1048576,  # 1MiB
+        algorithm: str = "sha256",
+        data: bytes = b"",
+    ):
+        """
+        Create a new tree hasher.
+
+        :param leaf_size: The size of each leaf, in bytes
+        :param algorithm: The name of the hashlib algorithm to digest with
+        :param data: Binary data to seed the hasher with
+        """
+        prototype = hashlib.new(algorithm)
+        self.algorithm = prototype.name
+        self.digest_size = prototype.digest_size
+        self.block_size = prototype.block_size
+        super().__init__(leaf_size, piece_factory=_HashlibFactory(algorithm))
+        if algorithm == "sha256":
+            self.name = "treehash:{}".format(format_size(leaf_size))
+        else:
+            self.name = "treehash-{}:{}".format(algorithm, format_size(leaf_size))
+        if data:
+            self.update(data)
+
+    def _combine(self, pieces: List[bytes]) -> bytes:
+        """Reduce the leaf digests to the root digest."""
+        if not pieces:
+            return hashlib.new(self.algorithm).digest()
+        level = pieces
+        while len(level) > 1:
+            parents = [
+                hashlib.new(self.algorithm, level[i] + level[i + 1]).digest()
+                for i in range(0, len(level) - 1, 2)
+            ]
+            if len(level) % 2:
+                parents.append(level[-1])
+            level = parents
+        return level[0]
+
+
+def update_in_parallel(
+    hashers: Iterable["HasherType"],
+    filepath: Union[str, PathLike],
+    chunksize: int = 8388608,  # 8MiB
+) -> bool:
+    """
+    Update piece hashers with a file, digesting its pieces in parallel.
+
+    This is only done when every hasher is a `PieceHasher` at a piece
+    boundary, eg: fresh, since any other hasher reads the whole file in
+    order anyway, and reading it a second time wouldn't be faster.
+
+    :param hashers: The hashers to update
+    :param filepath: A file path
+    :param chunksize: How many bytes each worker reads into RAM at once
+    :returns: Whether the hashers were updated
+    """
+    hashers = list(hashers)
+    pieced = [
+        hasher
+        for hasher in hashers
+        if isinstance(hasher, PieceHasher) and not hasher._current_size
+    ]
+    if not pieced or len(pieced) < len(hashers):
+        return False
+    for hasher in pieced:
+        hasher.update_from_filepath(filepath, chunksize=chunksize)
+    return True
+
+
+class _Checksum:
+    """Base class for hashers wrapping 32 bit checksum functions from zlib."""
+
+    name = "checksum"
+    digest_size = 4
+    block_size = 1
+    _initial = 0
+
+    def __init__(self, data: bytes = b""):
+        """
+        Create a new checksum hasher.
+
+        :param data: Binary data to seed the hasher with
+        """
+        self._value = self._initial
+        if data:
+            self.update(data)
+
+    # Updates a running checksum value, eg: zlib.crc32
+    _checksum: Callable[[Union[bytes, memoryview], int], int]
+
+    def update(self, data: Union[bytes, memoryview]) -> None:
+        """Update the hasher."""
+        self._value = self._checksum(data, self._value)
+
+    def digest(self) -> bytes:
+        """Produce a digest, big-endian."""
+        return self._value.to_bytes(4, "big")
+
+    def hexdigest(self) -> str:
+        """Produce a hexdigest."""
+        return "{:08x}".format(self._value)
+
+    def copy(self) -> "_Checksum":
+        """Produce a copy of the hasher."""
+        clone = self.__class__()
+        clone._value = self._value
+        return clone
+
+
+class CRC32(_Checksum):
+    """CRC-32, as used by zip and gzip, computed by `zlib.crc32`."""
+
+    name = "crc32"
+    _initial = 0
+    _checksum = staticmethod(zlib.crc32)
+
+
+class Adler32(_Checksum):
+    """Adler-32, as used by zlib streams, computed by `zlib.adler32`."""
+
+    name = "adler32"
+    _initial = 1
+    _checksum = staticmethod(zlib.adler32)
+
+
+def _optional(module_name: str, attribute: str, package: str) -> Callable:
+    """Return a factory for a hasher provided by an optional dependency."""
+
+    def factory() -> "HasherType":
+        """Import the optional dependency and return a hasher."""
+        try:
+            module = import_module(module_name)
+        except ImportError:
+            raise ValueError(
+                "unsupported hash type {}, install {} to enable it".format(
+                    attribute, package
+                )
+            ) from None
+        return getattr(module, attribute)()
+
+    return factory
+
+
+def _s3etag(part_size: Optional[str] = None) -> S3ETag:
+    """Create an S3ETag from a name argument."""
+    if part_size:
+        return S3ETag(parse_size(part_size))
+    return S3ETag()
+
+
+def _treehash(algorithm: str) -> Callable:
+    """Return a factory for TreeHash instances using some algorithm."""
+
+    def factory(leaf_size: Optional[str] = None) -> TreeHash:
+        """Create a TreeHash from a name argument."""
+        if leaf_size:
+            return TreeHash(parse_size(leaf_size), algorithm=algorithm)
+        return TreeHash(algorithm=algorithm)
+
+    return factory
+
+
+#: The group third party packages advertise hasher factories under.
+ENTRY_POINT_GROUP = "multihash.hashers"
+
+_REGISTRY: Dict[str, Callable] = {
+    "crc32": CRC32,
+    "adler32": Adler32,
+    "s3etag": _s3etag,
+    "treehash": _treehash("sha256"),
+    "xxh32": _optional("xxhash", "xxh32", "xxhash"),
+    "xxh64": _optional("xxhash", "xxh64", "xxhash"),
+    "xxh3_64": _optional("xxhash", "xxh3_64", "xxhash"),
+    "xxh3_128": _optional("xxhash", "xxh3_128", "xxhash"),
+    "blake3": _optional("blake3", "blake3", "blake3"),
+}
+_REGISTRY.update(
+    ("treehash-" + algorithm, _treehash(algorithm))
+    for algorithm in hashlib.algorithms_guaranteed
+    if not algorithm.startswith("shake_")
+)
+
+
+@lru_cache(maxsize=1)
+def _entry_points() -> Dict[str, Any]:
+    """Return the hasher factory entry points of installed packages, by name."""
+    # Imported here, as it's slow to import and rarely needed.
+    # pylint: disable=import-outside-toplevel
+    try:
+        from importlib import metadata  # type: ignore
+    except ImportError:  # Support python<3.8
+        try:
+            import importlib_metadata as metadata  # type: ignore
+        except ImportError:  # pragma: no cover
+            return {}
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        group = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:  # pragma: no cover  # Support python<3.10
+        group = entry_points.get(ENTRY_POINT_GROUP, [])  # type: ignore
+    return {entry_point.name: entry_point for entry_point in group}
+
+
+@lru_cache(maxsize=None)
+def _find_factory(algorithm: str) -> Optional[Callable]:
+    """
+    Find the factory registered for an algorithm name.
+
+    Returns None for names which should be handled by `hashlib.new()`.
+    """
+    if algorithm in _REGISTRY:
+        return _REGISTRY[algorithm]
+    if algorithm in hashlib.algorithms_available:
+        return None
+    entry_point = _entry_points().get(algorithm)
+    if entry_point is not None:
+        return entry_point.load()
+    return None
+
+
+def register(name: str, factory: Callable) -> None:
+    """
+    Register a hasher factory under a name.
+
+    The factory is called with no arguments to create a hasher for
+    "name", or with the argument string to create one for "name:argument".
+    Third party packages may instead advertise factories under the
+    `multihash.hashers` entry point group.
+
+    :param name: The name of the algorithm
+    :param factory: A callable returning an instance conforming to `HasherType`
+    """
+    _REGISTRY[name] = factory
+    _find_factory.cache_clear()
+
+
+def available() -> Set[str]:
+    """Return the names of all the algorithms which may be requested by name."""
+    return set(_REGISTRY) | set(_entry_points()) | hashlib.algorithms_available
+
+
+def new(name: str) -> "HasherType":
+    """
+    Create a new hasher from a name.
+
+    Names are resolved against the registered factories, then hashlib, then
+    the `multihash.hashers` entry points. Names may carry an argument for the
+    factory after a colon, eg: "s3etag:8MiB" or "treehash-sha1:256KiB".
+
+    :param name: The name of the hasher
+    """
+    algorithm, separator, argument = name.partition(":")
+    factory = _find_factory(algorithm)
+    if factory is None:
+        return hashlib.new(name)
+    if separator:
+        return factory(argument)
+    return factory()
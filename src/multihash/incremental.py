@@ -0,0 +1,106 @@
+"""
+Keep digests of append-only files current, hashing only what was appended.
+
+An `IncrementalFileHash` holds live hasher state and the offset hashed up to.
+Each `refresh()` reads just the bytes appended since, and returns digests
+finalized from copies of the hashers, so the running state is never
+disturbed. If the file was truncated, or replaced (eg: rotated) by a file
+with a different inode, it is rehashed from the start.
+
+A file truncated and then written past the old offset between refreshes,
+eg: by logrotate's copytruncate, keeps its inode and doesn't shrink. To
+catch it, the last `TAIL_SIZE` bytes hashed are read again and compared on
+each refresh, one small read. A rewrite which leaves those bytes as they
+were isn't noticed.
+"""
+
+import os
+from os import PathLike
+from typing import Iterable, Optional, Tuple, Union
+
+from multihash import HasherType, MultiHash
+from multihash.memory import MIN_CHUNKSIZE, get_memory_budget
+from multihash.parallel import iter_range
+
+#: How many bytes before the offset are compared on each refresh.
+TAIL_SIZE = 4096
+
+
+class IncrementalFileHash:
+    """Hashes a growing file, reading each byte once."""
+
+    def __init__(
+        self,
+        filepath: Union[str, PathLike],
+        hashers: Optional[Iterable[Union[HasherType, str]]] = None,
+        chunksize: int = 8388608,  # 8MiB
+    ):
+        """
+        Start tracking a file, call `refresh()` to hash it.
+
+        :param filepath: A file path
+        :param hashers: Instances of classes conforming to the
+            hashlib.hash interface, or names of hashes appropriate for
+            `multihash.hashers.new()`
+        :param chunksize: How many bytes to read into RAM at once
+        """
+        self.filepath = filepath
+        self.chunksize = chunksize
+        self._prototype = MultiHash(hashers=hashers)
+        self._multihash = self._fresh()
+        self._identity: Optional[Tuple[int, int]] = None
+        # The last bytes hashed, up to TAIL_SIZE of them
+        self._tail = b""
+        #: How many bytes of the file have been hashed
+        self.offset = 0
+        #: Whether the last refresh started again from the start of the file
+        self.restarted = False
+
+    def _fresh(self) -> MultiHash:
+        """Return a MultiHash with copies of the untouched prototype hashers."""
+        return MultiHash(hashers=self._prototype.copy().values())
+
+    def reset(self) -> None:
+        """Discard the hashed state, so the next refresh starts from byte 0."""
+        self._multihash = self._fresh()
+        self._identity = None
+        self._tail = b""
+        self.offset = 0
+
+    def _read_tail(self, fd: int) -> bytes:
+        """Read the bytes of the file where the last bytes hashed were."""
+        start = self.offset - len(self._tail)
+        return b"".join(iter_range(fd, start, len(self._tail), TAIL_SIZE))
+
+    def refresh(self) -> MultiHash:
+        """
+        Hash any appended bytes.
+
+        :returns: A MultiHash of the whole file as it is now, independent of
+            the running state
+        """
+        fd = os.open(self.filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            stat = os.fstat(fd)
+            identity = (stat.st_dev, stat.st_ino)
+            self.restarted = self._identity is not None and (
+                identity != self._identity
+                or stat.st_size < self.offset
+                or self._read_tail(fd) != self._tail
+            )
+            if self.restarted:
+                self.reset()
+            self._identity = identity
+            budget = get_memory_budget()
+            with budget.reserve(self.chunksize, MIN_CHUNKSIZE) as chunksize:
+                for chunk in iter_range(fd, self.offset, None, chunksize):
+                    self._multihash.update(chunk)
+                    self.offset += len(chunk)
+                    self._tail = (self._tail + chunk[-TAIL_SIZE:])[-TAIL_SIZE:]
+        finally:
+            os.close(fd)
+        return self.snapshot()
+
+    def snapshot(self) -> MultiHash:
+        """Return a MultiHash of what has been hashed so far, without reading."""
+        return MultiHash(hashers=self._multihash.copy().values())
@@ -0,0 +1,310 @@
+"""
+Compact indexes of known digests, for filtering out known files.
+
+A `KnownHashIndex` stores digests as a sorted array of fixed width binary
+records, searched with bisect, rather than as a set of hex strings, which
+uses roughly a fifth of the memory. An optional Bloom filter in front
+answers most misses without touching the array. Indexes may be saved to a
+file and memory-mapped, so they load instantly and are shared between
+processes through the page cache.
+
+Building an index holds the records twice over while they're sorted, and
+takes a couple of seconds per million digests, so large sets of known
+digests are best built once and saved, eg: with
+``multihash build-known-index``.
+"""
+
+import hashlib
+import heapq
+import math
+import mmap
+import struct
+from bisect import bisect_left
+from os import PathLike
+from typing import Iterable, Iterator, Optional, Union
+
+#: The leading bytes of a saved index file.
+INDEX_MAGIC = b"MHKNOWN1"
+# Digest width, record count, Bloom filter size in bytes, Bloom hash count
+_HEADER = struct.Struct("<IQQI")
+
+# Records and filters live in RAM, or in a memory-mapped index file
+_Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# How many records are sorted at once, before the sorted runs are merged
+_RUN_RECORDS = 65536
+
+
+class BloomFilter:
+    """A Bloom filter over digests, using double hashing of a blake2b digest."""
+
+    def __init__(
+        self,
+        size: int,
+        hashes: int,
+        data: Optional[Union[bytearray, memoryview]] = None,
+    ):
+        """
+        Create a new Bloom filter.
+
+        :param size: The size of the filter, in bytes
+        :param hashes: How many bits are set per entry
+        :param data: Existing filter contents, eg: a memory map
+        """
+        self.size = size
+        self.hashes = hashes
+        self._bits = size * 8
+        self.data = bytearray(size) if data is None else data
+
+    @classmethod
+    def for_capacity(cls, count: int, error_rate: float) -> "BloomFilter":
+        """
+        Create a Bloom filter sized for some number of entries.
+
+        :param count: How many entries will be added
+        :param error_rate: The desired false positive rate, eg: 0.01
+        """
+        count = max(count, 1)
+        bits = -count * math.log(error_rate) / math.log(2) ** 2
+        size = max(int(math.ceil(bits / 8)), 1)
+        hashes = max(int(round(size * 8 / count * math.log(2))), 1)
+        return cls(size, hashes)
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        """Return the bit positions for a digest."""
+        mixed = hashlib.blake2b(digest, digest_size=16).digest()
+        first = int.from_bytes(mixed[:8], "little")
+        second = int.from_bytes(mixed[8:], "little") | 1
+        return ((first + i * second) % self._bits for i in range(self.hashes))
+
+    def add(self, digest: bytes) -> None:
+        """Add a digest to the filter."""
+        for position in self._positions(digest):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        """Check if a digest may have been added."""
+        return all(
+            self.data[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+
+class _Records:
+    """A read only sequence view of fixed width records in a buffer."""
+
+    def __init__(self, data: _Buffer, width: int, count: int):
+        """Wrap a buffer of count records of width bytes."""
+        self._view = memoryview(data)
+        self._width = width
+        self._count = count
+
+    def __len__(self) -> int:
+        """Return the number of records."""
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        """Return a record."""
+        start = index * self._width
+        return self._view[start : start + self._width].tobytes()
+
+
+def _to_bytes(digest: Union[bytes, str]) -> bytes:
+    """Normalize a digest given as bytes or a hex string."""
+    if isinstance(digest, str):
+        return bytes.fromhex(digest)
+    return bytes(digest)
+
+
+def _sort_records(records: bytearray, width: int) -> bytearray:
+    """
+    Return fixed width records sorted, without duplicates.
+
+    Runs of records are sorted in place, then merged into a new array, so
+    only a run's worth of records are Python objects at once.
+    """
+    if not records:
+        return bytearray()
+    run_size = _RUN_RECORDS * width
+    runs = [
+        (start, min(start + run_size, len(records)))
+        for start in range(0, len(records), run_size)
+    ]
+    with memoryview(records) as view:
+        for start, stop in runs:
+            run = sorted(
+                view[offset : offset + width].tobytes()
+                for offset in range(start, stop, width)
+            )
+            view[start:stop] = b"".join(run)
+
+        def iter_run(start: int, stop: int) -> Iterator[bytes]:
+            """Yield the records in a sorted run."""
+            for offset in range(start, stop, width):
+                yield view[offset : offset + width].tobytes()
+
+        merged = bytearray()
+        last = None
+        for record in heapq.merge(*(iter_run(start, stop) for start, stop in runs)):
+            if record != last:
+                merged += record
+                last = record
+    return merged
+
+
+class KnownHashIndex:
+    """A sorted array of known digests of a single width, searched with bisect."""
+
+    def __init__(
+        self,
+        data: _Buffer,
+        width: int,
+        count: int,
+        bloom: Optional[BloomFilter] = None,
+    ):
+        """
+        Wrap sorted, deduplicated records, use the from_* or load methods.
+
+        :param data: count records of width bytes, sorted
+        :param width: The size of each digest, in bytes
+        :param count: How many records there are
+        :param bloom: A Bloom filter holding every record, or None
+        """
+        self.width = width
+        self.bloom = bloom
+        self._data = data
+        self._records = _Records(data, width, count)
+
+    @classmethod
+    def from_digests(
+        cls,
+        digests: Iterable[Union[bytes, str]],
+        bloom_error_rate: Optional[float] = 0.01,
+    ) -> "KnownHashIndex":
+        """
+        Build an index from digests.
+
+        :param digests: Digests as bytes or hex strings, all the same size
+        :param bloom_error_rate: The false positive rate of the Bloom filter
+            placed in front of the array, or None for no filter
+        """
+        records = bytearray()
+        width = -1
+        for digest in digests:
+            record = _to_bytes(digest)
+            if width < 0:
+                width = len(record)
+            elif len(record) != width:
+                raise ValueError("Known digests must all be the same size")
+            records += record
+        width = max(width, 0)
+        records = _sort_records(records, width)
+        count = len(records) // width if width else 0
+        bloom = None
+        if bloom_error_rate is not None:
+            bloom = BloomFilter.for_capacity(count, bloom_error_rate)
+            sorted_records = _Records(records, width, count)
+            for index in range(count):
+                bloom.add(sorted_records[index])
+        return cls(records, width, count, bloom)
+
+    @classmethod
+    def from_hexfile(
+        cls, path: Union[str, PathLike], bloom_error_rate: Optional[float] = 0.01
+    ) -> "KnownHashIndex":
+        """
+        Build an index from a text file of hex digests.
+
+        The first whitespace separated field of each line is used, so the
+        output of tools such as md5sum may be used directly. Blank lines
+        and lines starting with "#" are skipped.
+
+        :param path: The path of the text file
+        :param bloom_error_rate: See `from_digests()`
+        """
+        with open(path, "r") as hexfile:
+            digests = (
+                line.split()[0]
+                for line in hexfile
+                if line.strip() and not line.startswith("#")
+            )
+            return cls.from_digests(digests, bloom_error_rate)
+
+    @classmethod
+    def load(
+        cls, path: Union[str, PathLike], use_mmap: bool = True
+    ) -> "KnownHashIndex":
+        """
+        Load an index saved with `save()`.
+
+        :param path: The path of the index file
+        :param use_mmap: Memory-map the file rather than reading it into RAM
+        """
+        data: _Buffer
+        with open(path, "rb") as index_file:
+            if use_mmap:
+                data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = index_file.read()
+        if data[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError("Not a known hash index: {}".format(path))
+        view = memoryview(data)
+        start = len(INDEX_MAGIC)
+        width, count, bloom_size, bloom_hashes = _HEADER.unpack_from(view, start)
+        start += _HEADER.size
+        records = view[start : start + width * count]
+        start += width * count
+        bloom = None
+        if bloom_size:
+            bloom_data = view[start : start + bloom_size]
+            bloom = BloomFilter(bloom_size, bloom_hashes, bloom_data)
+        return cls(records, width, count, bloom)
+
+    @classmethod
+    def open(
+        cls, path: Union[str, PathLike], bloom_error_rate: Optional[float] = 0.01
+    ) -> "KnownHashIndex":
+        """
+        Load a saved index, or build one from a text file of hex digests.
+
+        :param path: The path of an index file or a text file
+        :param bloom_error_rate: See `from_digests()`, only used for text files
+        """
+        with open(path, "rb") as candidate:
+            magic = candidate.read(len(INDEX_MAGIC))
+        if magic == INDEX_MAGIC:
+            return cls.load(path)
+        return cls.from_hexfile(path, bloom_error_rate)
+
+    def save(self, path: Union[str, PathLike]) -> None:
+        """
+        Save the index, so it may be memory-mapped by `load()`.
+
+        :param path: The path to write the index file to
+        """
+        bloom_size = self.bloom.size if self.bloom is not None else 0
+        bloom_hashes = self.bloom.hashes if self.bloom is not None else 0
+        with open(path, "wb") as index_file:
+            index_file.write(INDEX_MAGIC)
+            header = _HEADER.pack(self.width, len(self), bloom_size, bloom_hashes)
+            index_file.write(header)
+            index_file.write(self._data)
+            if self.bloom is not None:
+                index_file.write(self.bloom.data)
+
+    def __len__(self) -> int:
+        """Return the number of known digests."""
+        return len(self._records)
+
+    def __contains__(self, digest: Union[bytes, str]) -> bool:
+        """Check if a digest, as bytes or a hex string, is known."""
+        try:
+            digest = _to_bytes(digest)
+        except ValueError:
+            return False  # Not a hex digest, eg: a multipart s3etag
+        if len(digest) != self.width:
+            return False
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        position = bisect_left(self._records, digest)  # type: ignore
+        return position < len(self._records) and self._records[position] == digest
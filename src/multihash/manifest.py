@@ -0,0 +1,234 @@
+"""
+A compact, self-describing binary format for digest manifests.
+
+A manifest is the magic bytes followed by a sequence of records, each
+starting with a varint record type:
+
+* PATH: a varint length and a UTF-8 path. The digests that follow belong
+  to this path.
+* DIGEST: a multiformats multihash, ie: a varint algorithm code, a varint
+  digest length and the raw digest bytes.
+* NAME: a varint algorithm code, a varint length and a UTF-8 algorithm
+  name, declaring a private use code for an algorithm with no multicodec.
+
+Raw digests are less than half the size of hex strings in JSON, and don't
+need decoding, so large manifests are much smaller and faster to load.
+"""
+
+from typing import BinaryIO, Dict, Iterator, Mapping, Optional, Tuple, Union
+
+#: The leading bytes of a binary manifest.
+MAGIC = b"MHM\x01"
+
+PATH, DIGEST, NAME = 0, 1, 2
+
+#: Multicodec codes for algorithm names, see github.com/multiformats/multicodec
+MULTICODECS = {
+    "sha1": 0x11,
+    "sha256": 0x12,
+    "sha512": 0x13,
+    "sha3_512": 0x14,
+    "sha3_384": 0x15,
+    "sha3_256": 0x16,
+    "sha3_224": 0x17,
+    "sha384": 0x20,
+    "md5": 0xD5,
+    "sha224": 0x1013,
+    "sha512_224": 0x1014,
+    "sha512_256": 0x1015,
+    "ripemd160": 0x1053,
+    "sm3": 0x534D,
+    "crc32": 0x0132,
+    "blake3": 0x1E,
+    "blake2b": 0xB240,
+    "blake2s": 0xB260,
+    "xxh32": 0xB3E1,
+    "xxh64": 0xB3E2,
+    "xxh3_64": 0xB3E3,
+    "xxh3_128": 0xB3E4,
+}
+
+# The start of the multicodec private use range, for declared names
+_PRIVATE_USE = 0x300000
+
+_READ_SIZE = 1048576  # 1MiB
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode an unsigned integer as a multiformats (LEB128) varint."""
+    if value < 0:
+        raise ValueError("varints must be non-negative")
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _as_digest(value: Union[bytes, str]) -> bytes:
+    """Normalize a digest given as bytes or a hex string."""
+    if isinstance(value, str):
+        # S3 ETags carry a "-N" part count, which isn't part of the digest
+        return bytes.fromhex(value.split("-", 1)[0])
+    return value
+
+
+class ManifestWriter:
+    """Writes path and digest records to a binary stream."""
+
+    def __init__(self, stream: BinaryIO):
+        """
+        Start a manifest, writing the magic bytes.
+
+        :param stream: An object which implements .write()
+        """
+        self._stream = stream
+        self._codes = dict(MULTICODECS)
+        self._next_private = _PRIVATE_USE
+        stream.write(MAGIC)
+
+    def _code(self, name: str) -> int:
+        """Return the code for an algorithm, declaring a private one if needed."""
+        if name not in self._codes:
+            encoded = name.encode("utf-8")
+            self._codes[name] = self._next_private
+            self._stream.write(
+                encode_varint(NAME)
+                + encode_varint(self._next_private)
+                + encode_varint(len(encoded))
+                + encoded
+            )
+            self._next_private += 1
+        return self._codes[name]
+
+    def write(self, path: str, digests: Mapping[str, Union[bytes, str]]) -> None:
+        """
+        Write a path and its digests.
+
+        :param path: The path
+        :param digests: Digests keyed by algorithm name, eg: from
+            `MultiHash.digest()`. Hex strings are accepted and stored raw,
+            other values (eg: flags) are skipped.
+        """
+        encoded = path.encode("utf-8")
+        records = [encode_varint(PATH), encode_varint(len(encoded)), encoded]
+        for name, value in sorted(digests.items()):
+            if not isinstance(value, (bytes, str)):
+                continue
+            digest = _as_digest(value)
+            code = self._code(name)
+            records += [
+                encode_varint(DIGEST),
+                encode_varint(code),
+                encode_varint(len(digest)),
+                digest,
+            ]
+        self._stream.write(b"".join(records))
+
+
+class _Parser:
+    """Parses records from a stream, reading it in large blocks."""
+
+    def __init__(self, stream: BinaryIO, data: bytes = b""):
+        """Wrap a stream, some of which may already have been read into data."""
+        self._stream = stream
+        self._data = data
+        self._position = 0
+
+    def _fill(self, size: int) -> bool:
+        """Ensure size bytes are buffered, returning False at a clean EOF."""
+        while len(self._data) - self._position < size:
+            block = self._stream.read(max(_READ_SIZE, size))
+            if not block:
+                if self._position == len(self._data):
+                    return False
+                raise ValueError("Truncated manifest")
+            self._data = self._data[self._position :] + block
+            self._position = 0
+        return True
+
+    def varint(self) -> Optional[int]:
+        """Read a varint, returning None at a clean EOF."""
+        value = 0
+        shift = 0
+        while True:
+            if not self._fill(1):
+                if shift:
+                    raise ValueError("Truncated manifest")
+                return None
+            byte = self._data[self._position]
+            self._position += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def required_varint(self) -> int:
+        """Read a varint which must be present."""
+        value = self.varint()
+        if value is None:
+            raise ValueError("Truncated manifest")
+        return value
+
+    def read(self, size: int) -> bytes:
+        """Read size bytes."""
+        if size and not self._fill(size):
+            raise ValueError("Truncated manifest")
+        data = self._data[self._position : self._position + size]
+        self._position += size
+        return data
+
+
+def read_manifest(stream: BinaryIO) -> Iterator[Tuple[str, Dict[str, bytes]]]:
+    """
+    Read a binary manifest.
+
+    Algorithms without a known or declared name are named by their code in
+    hex, eg: "0x1234".
+
+    :param stream: An object which implements .read()
+    :returns: An iterator of paths and their digests, keyed by algorithm name
+    """
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a binary multihash manifest")
+    names = {code: name for name, code in MULTICODECS.items()}
+    parser = _Parser(stream)
+    path: Optional[str] = None
+    digests: Dict[str, bytes] = {}
+    while True:
+        record = parser.varint()
+        if record is None:
+            break
+        if record == PATH:
+            if path is not None:
+                yield path, digests
+            path = parser.read(parser.required_varint()).decode("utf-8")
+            digests = {}
+        elif record == DIGEST:
+            code = parser.required_varint()
+            digest = parser.read(parser.required_varint())
+            if path is None:
+                raise ValueError("Digest record before any path record")
+            digests[names.get(code, hex(code))] = digest
+        elif record == NAME:
+            code = parser.required_varint()
+            names[code] = parser.read(parser.required_varint()).decode("utf-8")
+        else:
+            raise ValueError("Unknown record type: {}".format(record))
+    if path is not None:
+        yield path, digests
+
+
+def write_manifest(
+    stream: BinaryIO, results: Mapping[str, Mapping[str, Union[bytes, str]]]
+) -> None:
+    """
+    Write a whole binary manifest.
+
+    :param stream: An object which implements .write()
+    :param results: Digests keyed by algorithm name, keyed by path
+    """
+    writer = ManifestWriter(stream)
+    for path, digests in results.items():
+        writer.write(path, digests)
@@ -0,0 +1,127 @@
+"""
+A process wide budget for the memory used by read buffers.
+
+Every file or stream hashed holds a read buffer of up to chunksize bytes, so
+hashing concurrently multiplies memory use. Readers reserve their buffers
+from a `MemoryBudget` first: when the budget is short they get a smaller
+buffer, down to `MIN_CHUNKSIZE`, and when it's exhausted they wait for
+another reader to finish. Throughput degrades, rather than the process
+running out of memory.
+
+The process wide budget, used by `MultiHash.from_stream()`, `from_range()`,
+`from_filepath()` and `multihash.engine`, is unlimited until
+`set_memory_budget()` is called.
+"""
+
+from contextlib import contextmanager
+from threading import Condition
+from typing import Iterator, Optional
+
+#: The smallest buffer a reader will settle for, rather than waiting.
+MIN_CHUNKSIZE = 65536  # 64KiB
+
+
+class MemoryBudget:
+    """Counts reserved bytes, shrinking or delaying reservations over a limit."""
+
+    def __init__(self, limit: Optional[int] = None):
+        """
+        Create a new budget.
+
+        :param limit: How many bytes may be reserved at once, None for no limit
+        """
+        self._limit = limit
+        self._used = 0
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> Optional[int]:
+        """How many bytes may be reserved at once, None for no limit."""
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit: Optional[int]) -> None:
+        """Change the limit, waking any waiting reservations."""
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    @property
+    def used(self) -> int:
+        """How many bytes are reserved."""
+        return self._used
+
+    @property
+    def available(self) -> Optional[int]:
+        """How many more bytes may be reserved, None for no limit."""
+        if self._limit is None:
+            return None
+        return max(self._limit - self._used, 0)
+
+    def acquire(
+        self, size: int, minimum: Optional[int] = None, timeout: Optional[float] = None
+    ) -> int:
+        """
+        Reserve up to size bytes, and at least minimum bytes.
+
+        Waits until minimum bytes are available, or nothing else is reserved,
+        so a reservation larger than the limit can't wait forever.
+
+        :param size: How many bytes to reserve, ideally
+        :param minimum: How few bytes to settle for, defaults to size
+        :param timeout: How many seconds to wait, None waits forever
+        :returns: How many bytes were reserved, to be passed to `release()`
+        """
+        minimum = size if minimum is None else min(minimum, size)
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._limit is None
+                or not self._used
+                or self._limit - self._used >= minimum,
+                timeout,
+            ):
+                raise TimeoutError("Timed out waiting for the memory budget")
+            granted = size
+            if self._limit is not None:
+                granted = max(min(size, self._limit - self._used), minimum)
+            self._used += granted
+        return granted
+
+    def release(self, size: int) -> None:
+        """Release a reservation."""
+        with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(
+        self, size: int, minimum: Optional[int] = None, timeout: Optional[float] = None
+    ) -> Iterator[int]:
+        """Reserve bytes for the duration of a with block, see `acquire()`."""
+        granted = self.acquire(size, minimum, timeout)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+
+_BUDGET = MemoryBudget()
+
+
+def get_memory_budget() -> MemoryBudget:
+    """Return the process wide memory budget."""
+    return _BUDGET
+
+
+def set_memory_budget(limit: Optional[int]) -> None:
+    """
+    Limit the memory used by read buffers, across the whole process.
+
+    :param limit: How many bytes may be reserved at once, None for no limit
+    """
+    _BUDGET.limit = limit
+
+
+def memory_usage() -> int:
+    """Return how many bytes of the process wide budget are reserved."""
+    return _BUDGET.used
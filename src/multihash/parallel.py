@@ -0,0 +1,109 @@
+"""
+Helpers for hashing independent byte ranges of a file in parallel.
+
+Ranges are read with `os.pread`, so no file position is shared between
+workers. Where it isn't available, eg: on Windows, each read seeks first, so
+a file descriptor mustn't be shared between workers. hashlib releases the
+GIL while digesting large buffers, so a thread pool scales across cores for
+the stdlib algorithms; a process pool is available for hashers which do not.
+"""
+
+import os
+from os import PathLike
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+def _seek_and_read(fd: int, size: int, offset: int) -> bytes:
+    """Read from an offset of a file, like `os.pread`, moving its position."""
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def iter_range(
+    fd: int, offset: int, length: Optional[int], chunksize: int
+) -> Iterator[bytes]:
+    """
+    Yield the bytes of a range of an open file, at most chunksize at a time.
+
+    Stops early if the end of the file is reached before length bytes are read.
+
+    :param fd: An open file descriptor
+    :param offset: The byte offset to start reading at
+    :param length: How many bytes to read, None reads to the end of the file
+    :param chunksize: How many bytes to read into RAM at once
+    """
+    if offset < 0:
+        raise ValueError("offset must be non-negative")
+    if length is not None and length < 0:
+        raise ValueError("length must be non-negative or None")
+    pread = getattr(os, "pread", _seek_and_read)
+    end = None if length is None else offset + length
+    while end is None or offset < end:
+        size = chunksize if end is None else min(chunksize, end - offset)
+        chunk = pread(fd, size, offset)
+        if not chunk:
+            break
+        offset += len(chunk)
+        yield chunk
+
+
+def _hash_range(
+    filepath: Union[str, PathLike],
+    offset: int,
+    length: int,
+    hasher_factory: Callable,
+    chunksize: int,
+) -> bytes:
+    """Return the digest of a single byte range of a file."""
+    hasher = hasher_factory()
+    fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        for chunk in iter_range(fd, offset, length, chunksize):
+            hasher.update(chunk)
+    finally:
+        os.close(fd)
+    return hasher.digest()
+
+
+def hash_ranges(
+    filepath: Union[str, PathLike],
+    ranges: Sequence[Tuple[int, int]],
+    hasher_factory: Callable,
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+    chunksize: int = 8388608,  # 8MiB
+) -> List[bytes]:
+    """
+    Digest several byte ranges of a file concurrently.
+
+    :param filepath: A file path
+    :param ranges: (offset, length) pairs to digest
+    :param hasher_factory: A callable returning a fresh hasher, eg: `hashlib.md5`.
+        Must be picklable if use_processes is True.
+    :param max_workers: How many ranges to digest at once, defaults to the
+        number of CPUs
+    :param use_processes: Use a process pool rather than a thread pool
+    :param chunksize: How many bytes each worker reads into RAM at once
+    :returns: The digests, in the same order as ranges
+    """
+    if not ranges:
+        return []
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(ranges) == 1:
+        return [
+            _hash_range(filepath, offset, length, hasher_factory, chunksize)
+            for offset, length in ranges
+        ]
+    # Imported here, as it's slow to import and only needed for several ranges.
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=min(max_workers, len(ranges))) as executor:
+        futures = [
+            executor.submit(
+                _hash_range, filepath, offset, length, hasher_factory, chunksize
+            )
+            for offset, length in ranges
+        ]
+        return [future.result() for future in futures]
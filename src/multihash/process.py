@@ -0,0 +1,360 @@
+"""
+Run hashers in worker processes, passing data through shared memory.
+
+Hashers which hold the GIL (pure Python, or C extensions which don't release
+it) can't be sped up with threads. A `SharedMemoryPool` hosts each such hasher
+in its own worker process, and hands out `ProcessHasher` proxies conforming to
+`HasherType` which may be given to `MultiHash` like any other hasher.
+
+Chunks are copied once into a ring of shared memory slots rather than being
+pickled, and every worker reads the same slot, so N process-backed hashers
+don't copy a chunk N times. Requires python>=3.8.
+"""
+
+import multiprocessing
+import weakref
+from multiprocessing.connection import Connection, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+
+from multihash import HasherType
+from multihash.hashers import new as new_hasher
+
+try:
+    from multiprocessing import shared_memory  # type: ignore
+except ImportError:  # Support python<3.8
+    shared_memory = None  # type: ignore
+
+
+def _buf(shm: Any) -> memoryview:
+    """Return a shared memory block's buffer, which is only None once closed."""
+    return cast(memoryview, shm.buf)
+
+
+def _nothing() -> None:
+    """Stand in for a reference to data which may not be kept."""
+    return None
+
+
+def _reference(data: Any) -> Callable[[], Any]:
+    """
+    Return a callable returning data, without keeping a view of it alive.
+
+    A kept memoryview would stop its buffer, eg: a bytearray, from being
+    resized, so views are referenced weakly, and bytes, which are immutable
+    and export nothing, directly. Other buffers, which may change between
+    calls, aren't referenced at all.
+    """
+    if isinstance(data, bytes):
+        return lambda: data
+    if isinstance(data, memoryview):
+        return weakref.ref(data)
+    return _nothing
+
+
+def _worker(conn: Connection, shm_name: str, slot_size: int, hasher: Any) -> None:
+    """
+    Host hashers in a worker process.
+
+    Hashers are keyed by integers, key 0 is the initial hasher, copies get
+    new keys. Updates are acknowledged per slot so the parent can reuse it,
+    errors raised by updates are reported on the next request.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        try:
+            if isinstance(hasher, str):
+                hasher = new_hasher(hasher)
+            elif isinstance(hasher, type) or not hasattr(hasher, "update"):
+                hasher = hasher()
+        except Exception as exc:  # pylint: disable=W0703
+            conn.send(("error", exc))
+            return
+        conn.send(("ready", hasher.name, hasher.digest_size, hasher.block_size))
+        hashers = {0: hasher}
+        errors: Dict[int, Exception] = {}
+        while True:
+            command, key, *args = conn.recv()
+            if command == "update":
+                slot, length = args
+                start = slot * slot_size
+                if key not in errors:
+                    with _buf(shm)[start : start + length] as view:
+                        try:
+                            hashers[key].update(view)
+                        except Exception as exc:  # pylint: disable=W0703
+                            errors[key] = exc
+                conn.send(("ack", slot))
+            elif command == "drop":
+                hashers.pop(key, None)
+                errors.pop(key, None)
+            elif command == "close":
+                return
+            elif key in errors:
+                conn.send(("error", errors[key]))
+            else:
+                try:
+                    if command == "copy":
+                        hashers[args[0]] = hashers[key].copy()
+                        result = None
+                    else:
+                        result = getattr(hashers[key], command)()
+                except Exception as exc:  # pylint: disable=W0703
+                    conn.send(("error", exc))
+                else:
+                    conn.send(("result", result))
+    finally:
+        shm.close()
+
+
+class _Worker:
+    """Parent side bookkeeping for a worker process."""
+
+    def __init__(self, process: multiprocessing.Process, conn: Connection):
+        """Store the process and its connection."""
+        self.process = process
+        self.conn = conn
+        self.next_key = 1
+        self.outstanding = 0
+
+
+def _drop(pool: "SharedMemoryPool", worker: _Worker, key: int) -> None:
+    """Free a hasher's state in its worker, once the proxy is collected."""
+    if not pool.closed:
+        worker.conn.send(("drop", key))
+
+
+class ProcessHasher:
+    """A proxy for a hasher living in a `SharedMemoryPool` worker process."""
+
+    def __init__(
+        self,
+        pool: "SharedMemoryPool",
+        worker: _Worker,
+        key: int,
+        info: Tuple[str, int, int],
+    ):
+        """
+        Create a new proxy, use `SharedMemoryPool.hasher()` rather than this.
+
+        :param pool: The pool the worker belongs to
+        :param worker: The worker hosting the hasher
+        :param key: The key of the hasher in the worker
+        :param info: The name, digest_size and block_size of the hasher
+        """
+        self._pool = pool
+        self._worker = worker
+        self._key = key
+        self._info = info
+        self.name, self.digest_size, self.block_size = info
+        weakref.finalize(self, _drop, pool, worker, key)
+
+    def update(self, data: Union[bytes, memoryview]) -> None:
+        """Update the hasher."""
+        for slot, length in self._pool._place(data, self):
+            self._worker.conn.send(("update", self._key, slot, length))
+            self._worker.outstanding += 1
+            self._pool._pending[slot] += 1
+
+    def _request(self, command: str, *args) -> Any:
+        """Send a request to the worker and wait for its reply."""
+        self._pool._check_open()
+        self._worker.conn.send((command, self._key) + args)
+        return self._pool._receive(self._worker)
+
+    def digest(self) -> bytes:
+        """Produce a digest."""
+        return self._request("digest")
+
+    def hexdigest(self) -> str:
+        """Produce a hexdigest."""
+        return self._request("hexdigest")
+
+    def copy(self) -> "ProcessHasher":
+        """Produce a copy of the hasher, hosted by the same worker."""
+        key = self._worker.next_key
+        self._worker.next_key += 1
+        self._request("copy", key)
+        return ProcessHasher(self._pool, self._worker, key, self._info)
+
+
+class SharedMemoryPool:
+    """
+    A pool of worker processes hosting hashers, fed through shared memory.
+
+    Not thread safe; use one pool per thread. Use as a context manager, or
+    call `close()`, to stop the workers and free the shared memory.
+    """
+
+    def __init__(
+        self,
+        slots: int = 4,
+        slot_size: int = 8388608,  # 8MiB
+        context: Optional[Any] = None,
+    ):
+        """
+        Create a new pool.
+
+        :param slots: How many chunks may be in flight at once
+        :param slot_size: The size of each shared memory slot, in bytes. Larger
+            chunks are split across several slots.
+        :param context: A multiprocessing context, defaults to the default one
+        """
+        if shared_memory is None:  # pragma: no cover
+            raise RuntimeError("SharedMemoryPool requires python>=3.8")
+        if slots < 1 or slot_size < 1:
+            raise ValueError("slots and slot_size must be positive")
+        self.slot_size = slot_size
+        self._context = context or multiprocessing.get_context()
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self._free: List[int] = list(range(slots))
+        self._pending: Dict[int, int] = dict.fromkeys(range(slots), 0)
+        self._workers: List[_Worker] = []
+        # The most recent data, where its pieces are and who has consumed it
+        self._current: Callable[[], Any] = _nothing
+        self._placed: List[Optional[Tuple[int, int]]] = []
+        self._held: Set[int] = set()
+        self._consumers: Set[ProcessHasher] = set()
+        self.closed = False
+
+    def __enter__(self) -> "SharedMemoryPool":
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the pool when leaving the context manager."""
+        self.close()
+
+    def _check_open(self) -> None:
+        """Raise if the pool has been closed."""
+        if self.closed:
+            raise ValueError("SharedMemoryPool is closed")
+
+    def hasher(self, hasher: Union[HasherType, str, Any]) -> ProcessHasher:
+        """
+        Start a worker process hosting a hasher, and return a proxy for it.
+
+        :param hasher: A name appropriate for `multihash.hashers.new()`, a
+            factory returning a hasher, or a hasher instance. Factories and
+            instances must be picklable unless the "fork" start method is used.
+        """
+        self._check_open()
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker,
+            args=(child_conn, self._shm.name, self.slot_size, hasher),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self._workers.append(worker)
+        info = self._receive(worker)
+        return ProcessHasher(self, worker, 0, tuple(info))
+
+    def hashers(
+        self, hashers: Iterable[Union[HasherType, str, Any]]
+    ) -> List[ProcessHasher]:
+        """Start a worker for each of several hashers, see `hasher()`."""
+        return [self.hasher(hasher) for hasher in hashers]
+
+    def _handle(self, worker: _Worker, message: Tuple) -> None:
+        """Handle a slot acknowledgement from a worker."""
+        slot = message[1]
+        worker.outstanding -= 1
+        self._pending[slot] -= 1
+        if not self._pending[slot] and slot not in self._held:
+            self._free.append(slot)
+
+    def _receive(self, worker: _Worker) -> Any:
+        """Wait for a reply from a worker, handling any acknowledgements first."""
+        while True:
+            try:
+                message = worker.conn.recv()
+            except EOFError:
+                raise RuntimeError("SharedMemoryPool worker exited unexpectedly")
+            if message[0] == "ack":
+                self._handle(worker, message)
+            elif message[0] == "error":
+                raise message[1]
+            elif message[0] == "ready":
+                return message[1:]
+            else:
+                return message[1]
+
+    def _acquire_slot(self) -> int:
+        """Return a free slot, waiting for workers to finish with one if needed."""
+        while not self._free:
+            for index, placed in enumerate(self._placed):
+                if placed is not None and not self._pending[placed[0]]:
+                    # Evict a piece no worker still needs, it's rewritten if asked for.
+                    self._placed[index] = None
+                    self._held.discard(placed[0])
+                    return placed[0]
+            busy = [worker.conn for worker in self._workers if worker.outstanding]
+            for ready in wait(busy):
+                worker = next(w for w in self._workers if w.conn is ready)
+                self._handle(worker, worker.conn.recv())
+        return self._free.pop()
+
+    def _place(
+        self, data: Union[bytes, memoryview], consumer: ProcessHasher
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Copy data into shared memory slots, yielding (slot, length) pairs.
+
+        MultiHash passes the same object to each of its hashers in turn, so
+        pieces of the most recent bytes or memoryview are reused rather than
+        copied again, until a hasher which already consumed it asks again.
+        Each pair must be sent to a worker before the next is requested.
+        """
+        self._check_open()
+        view = memoryview(data).cast("B")
+        if self._current() is not data or consumer in self._consumers:
+            for slot in self._held:
+                if not self._pending[slot]:
+                    self._free.append(slot)
+            self._held = set()
+            self._consumers = set()
+            self._current = _reference(data)
+            self._placed = [None] * -(-len(view) // self.slot_size)
+        self._consumers.add(consumer)
+        for index, start in enumerate(range(0, len(view), self.slot_size)):
+            placed = self._placed[index]
+            if placed is None:
+                piece = view[start : start + self.slot_size]
+                slot = self._acquire_slot()
+                offset = slot * self.slot_size
+                _buf(self._shm)[offset : offset + len(piece)] = piece
+                placed = self._placed[index] = (slot, len(piece))
+                self._held.add(slot)
+            yield placed
+
+    def close(self) -> None:
+        """Stop the worker processes and free the shared memory."""
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self._workers:
+            try:
+                worker.conn.send(("close", 0))
+            except (BrokenPipeError, OSError):  # pragma: no cover
+                pass
+        for worker in self._workers:
+            worker.process.join()
+            worker.conn.close()
+        self._current = _nothing
+        self._consumers = set()
+        self._shm.close()
+        self._shm.unlink()
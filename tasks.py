@@ -6,6 +6,8 @@ from glob import glob
 from pathlib import Path
 from shlex import quote
 from shutil import rmtree
+from tempfile import TemporaryDirectory
+from time import perf_counter
 
 from invoke import Collection, task
 
@@ -354,6 +356,71 @@ def release(c, prod=False, clean=True, build=True, skip_tests=False, autoformat=
     echo("Upload complete")
 
 
+@task(name="small-files")
+def bench_small_files(c, files=1000000, size=4096, workers=8, algos="md5,sha256"):
+    """
+    Benchmark hashing a tree of small files, in files per second.
+    """
+    import sys
+
+    sys.path.insert(0, str(Path("./src").resolve()))
+    from multihash import MultiHash
+    from multihash.engine import hash_files
+
+    hashers = algos.split(",")
+    with TemporaryDirectory() as tmpdir:
+        echo(f"Creating {files} files of {size} bytes in {tmpdir}...")
+        paths = []
+        for i in range(files):
+            directory = Path(tmpdir) / str(i // 1000)
+            directory.mkdir(exist_ok=True)
+            path = directory / str(i)
+            path.write_bytes(os.urandom(size))
+            paths.append(str(path))
+
+        def report(label, func):
+            start = perf_counter()
+            func()
+            elapsed = perf_counter() - start
+            echo(f"{label}: {files / elapsed:,.0f} files/s ({elapsed:.2f}s)")
+
+        report(
+            "from_filepath, per file",
+            lambda: [MultiHash.from_filepath(p, hashers=hashers) for p in paths],
+        )
+        report(
+            "hash_files, 1 worker",
+            lambda: list(hash_files(paths, hashers=hashers)),
+        )
+        report(
+            f"hash_files, {workers} workers",
+            lambda: list(hash_files(paths, hashers=hashers, max_workers=workers)),
+        )
+
+
+@task(name="startup")
+def bench_startup(c, runs=20):
+    """
+    Benchmark the cold start time of the CLI, against a bare interpreter.
+    """
+    import subprocess
+    import sys
+
+    env = dict(os.environ, PYTHONPATH=str(Path("./src").resolve()))
+
+    def report(label, code):
+        start = perf_counter()
+        for _ in range(runs):
+            subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        elapsed = (perf_counter() - start) / runs
+        echo(f"{label}: {elapsed * 1000:.1f}ms")
+
+    report("python", "pass")
+    report("import multihash", "import multihash")
+    report("import multihash.cli", "import multihash.cli")
+    echo("Run 'python -X importtime -c \"import multihash.cli\"' for details")
+
+
 # Make implicit root explicit
 ns = Collection()
 # Apply some default configurations
@@ -400,8 +467,15 @@ check_ns = Collection("check")
 check_ns.add_task(check_todos)
 
 
+# Define the "bench" subcommand
+bench_ns = Collection("bench")
+bench_ns.add_task(bench_small_files)
+bench_ns.add_task(bench_startup)
+
+
 # Add custom subcommands to root namespace
 ns.add_collection(run_ns)
 ns.add_collection(build_ns)
 ns.add_collection(clean_ns)
 ns.add_collection(check_ns)
+ns.add_collection(bench_ns)
@@ -0,0 +1,114 @@
+"""Tests for hashing archive members without extraction."""
+import hashlib
+import io
+import tarfile
+import zipfile
+from os import urandom
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from multihash import MultiHash
+
+MEMBERS = {"a.txt": b"This is some test data.\n", "dir/b.bin": urandom(5000)}
+
+
+def _expected():
+    """Return the expected digests of the members."""
+    return {
+        name: {
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        for name, data in MEMBERS.items()
+    }
+
+
+def _tar(mode="w:gz"):
+    """Build a tar archive of the members, including a directory entry."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        directory = tarfile.TarInfo("dir")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _zip():
+    """Build a zip archive of the members, including a directory entry."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("dir/", b"")
+        for name, data in MEMBERS.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class _Unseekable(io.RawIOBase):
+    """A pipe-like stream which can't seek."""
+
+    def __init__(self, data):
+        """Wrap some bytes."""
+        self._stream = io.BytesIO(data)
+
+    def readable(self):
+        """Report the stream is readable."""
+        return True
+
+    def readinto(self, buffer):
+        """Read into a buffer."""
+        return self._stream.readinto(buffer)
+
+
+@pytest.mark.parametrize("archive", [_tar("w:gz"), _tar("w:xz"), _zip()])
+def test_archive_stream(archive):
+    """Test hashing the members of archives from seekable streams."""
+    members = MultiHash.from_archive(
+        io.BytesIO(archive), hashers=["md5", "sha256"], chunksize=1000
+    )
+    result = {member.name: member.hashes.hexdigest() for member in members}
+    assert result == _expected()
+
+
+def test_tar_unseekable_stream():
+    """Test tar archives may be hashed from a pipe-like stream."""
+    members = list(
+        MultiHash.from_archive(_Unseekable(_tar("w:bz2")), hashers=["md5", "sha256"])
+    )
+    assert {m.name: m.hashes.hexdigest() for m in members} == _expected()
+    assert {m.name: m.size for m in members} == {
+        name: len(data) for name, data in MEMBERS.items()
+    }
+
+
+@pytest.mark.parametrize("archive", [_tar(), _zip()])
+def test_archive_filepath(archive):
+    """Test hashing the members of archives on disk."""
+    with NamedTemporaryFile() as temp:
+        temp.write(archive)
+        temp.flush()
+        members = MultiHash.from_archive(temp.name, hashers=["md5", "sha256"])
+        result = {member.name: member.hashes.hexdigest() for member in members}
+    assert result == _expected()
+
+
+def test_tar_ending_with_zip():
+    """Test a tar whose last member is a zip is hashed as a tar."""
+    inner = _zip()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo("inner.zip")
+        info.size = len(inner)
+        archive.addfile(info, io.BytesIO(inner))
+    expected = {"inner.zip": {"md5": hashlib.md5(inner).hexdigest()}}
+    members = MultiHash.from_archive(io.BytesIO(buffer.getvalue()), hashers=["md5"])
+    assert {m.name: m.hashes.hexdigest() for m in members} == expected
+    with NamedTemporaryFile() as temp:
+        temp.write(buffer.getvalue())
+        temp.flush()
+        members = MultiHash.from_archive(temp.name, hashers=["md5"])
+        assert {m.name: m.hashes.hexdigest() for m in members} == expected
@@ -0,0 +1,74 @@
+"""Tests for hashing buffer protocol objects."""
+import array
+import hashlib
+
+import pytest
+
+from multihash import MultiHash
+from multihash.buffers import iter_buffer
+
+
+def matrix():
+    """Return a 2-D view of 6 rows of 4 doubles."""
+    return memoryview(array.array("d", range(24))).cast("B").cast("d", (6, 4))
+
+
+def test_contiguous_is_not_copied():
+    """Contiguous buffers are yielded whole, as views of the same memory."""
+    data = bytearray(b"abcdef")
+    chunks = list(iter_buffer(data))
+    assert len(chunks) == 1
+    data[0:1] = b"z"
+    assert bytes(chunks[0]) == b"zbcdef"
+    (chunk,) = iter_buffer(matrix())
+    assert chunk.format == "B" and chunk.ndim == 1 and chunk.nbytes == 192
+
+
+@pytest.mark.parametrize("chunksize", [1, 16, 64, 1000])
+def test_non_contiguous(chunksize):
+    """Strided buffers are walked in chunks, in C order."""
+    strided = matrix()[::2]
+    assert not strided.c_contiguous
+    chunks = list(iter_buffer(strided, chunksize))
+    assert b"".join(bytes(chunk) for chunk in chunks) == strided.tobytes()
+    assert all(chunk.nbytes <= max(chunksize, 32) for chunk in chunks)
+
+
+def test_multihash_buffers():
+    """MultiHash accepts any buffer, matching hashlib on the flat bytes."""
+    values = array.array("i", range(1000))
+    expected = hashlib.sha256(values.tobytes()).hexdigest()
+    assert MultiHash(values, hashers=["sha256"]).hexdigest()["sha256"] == expected
+    assert MultiHash.from_buffer(values, ["sha256"]).hexdigest()["sha256"] == expected
+    strided = memoryview(values)[::3]
+    multihash = MultiHash.from_buffer(strided, ["md5", "crc32"], chunksize=100)
+    assert multihash.hexdigest()["md5"] == hashlib.md5(strided.tobytes()).hexdigest()
+
+
+def test_numpy():
+    """NumPy arrays, including non-contiguous slices, hash as their tobytes()."""
+    numpy = pytest.importorskip("numpy")
+    data = numpy.arange(10000, dtype="<f8").reshape(100, 100)
+    for value in (data, data[::2], data[:, ::3], data.T):
+        multihash = MultiHash.from_buffer(value, ["sha1"], chunksize=1000)
+        expected = hashlib.sha1(value.tobytes()).hexdigest()
+        assert multihash.hexdigest()["sha1"] == expected
+
+
+def test_empty():
+    """Empty buffers hash as no bytes, whatever their shape."""
+    empty = hashlib.md5().hexdigest()
+    assert list(iter_buffer(bytearray())) == []
+    assert MultiHash.from_buffer(array.array("d"), ["md5"]).hexdigest()["md5"] == empty
+
+
+def test_numpy_edge_cases():
+    """Zero-size arrays, and arrays with no truth value, are hashed."""
+    numpy = pytest.importorskip("numpy")
+    empty = hashlib.md5().hexdigest()
+    for value in (numpy.zeros((0, 3)), numpy.zeros((3, 0)), numpy.zeros((4, 6))[:, :0]):
+        assert MultiHash.from_buffer(value, ["md5"]).hexdigest()["md5"] == empty
+        assert MultiHash(value, hashers=["md5"]).hexdigest()["md5"] == empty
+    for value in (numpy.array([0]), numpy.arange(12)):
+        expected = hashlib.md5(value.tobytes()).hexdigest()
+        assert MultiHash(value, hashers=["md5"]).hexdigest()["md5"] == expected
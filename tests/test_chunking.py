@@ -0,0 +1,90 @@
+"""Tests for content-defined chunking."""
+import hashlib
+from io import BytesIO
+from random import Random
+
+import pytest
+
+from multihash import chunking
+from multihash.chunking import iter_chunks
+
+SIZES = {"min_size": 256, "avg_size": 1024, "max_size": 4096}
+
+
+def _data(size, seed=0):
+    """Return reproducible pseudo-random bytes."""
+    return bytes(Random(seed).getrandbits(8) for _ in range(size))
+
+
+def test_chunks_cover_stream():
+    """Test chunks are contiguous, within bounds and hash their bytes."""
+    data = _data(100000)
+    chunks = list(
+        iter_chunks(BytesIO(data), hashers=["md5", "sha256"], chunksize=5000, **SIZES)
+    )
+    assert len(chunks) > 1
+    offset = 0
+    for chunk in chunks:
+        assert chunk.offset == offset
+        assert chunk.length <= SIZES["max_size"]
+        piece = data[chunk.offset : chunk.offset + chunk.length]
+        assert chunk.hashes.hexdigest() == {
+            "md5": hashlib.md5(piece).hexdigest(),
+            "sha256": hashlib.sha256(piece).hexdigest(),
+        }
+        offset += chunk.length
+    assert offset == len(data)
+    assert all(chunk.length >= SIZES["min_size"] for chunk in chunks[:-1])
+
+
+def test_chunks_independent_of_read_size():
+    """Test chunk boundaries don't depend on how the stream is read."""
+    data = _data(50000, seed=1)
+    small_reads = iter_chunks(BytesIO(data), chunksize=1, **SIZES)
+    large_reads = iter_chunks(BytesIO(data), chunksize=10 ** 6, **SIZES)
+    assert [(c.offset, c.length) for c in small_reads] == [
+        (c.offset, c.length) for c in large_reads
+    ]
+
+
+def test_chunks_resynchronize_after_insert():
+    """Test an insertion only changes the chunks around it."""
+    data = _data(100000, seed=2)
+    edited = data[:50000] + b"inserted bytes" + data[50000:]
+
+    def digests(blob):
+        """Return the set of chunk digests."""
+        return {
+            c.hashes.hexdigest()["sha256"]
+            for c in iter_chunks(BytesIO(blob), hashers=["sha256"], **SIZES)
+        }
+
+    original = digests(data)
+    assert len(original - digests(edited)) <= 3
+
+
+def test_empty_stream():
+    """Test an empty stream produces no chunks."""
+    assert list(iter_chunks(BytesIO(b""), hashers=["md5"])) == []
+
+
+def test_invalid_sizes():
+    """Test nonsensical size settings are refused."""
+    with pytest.raises(ValueError):
+        list(iter_chunks(BytesIO(b"x"), min_size=10, avg_size=8, max_size=64))
+    with pytest.raises(ValueError):
+        list(iter_chunks(BytesIO(b"x"), min_size=1, avg_size=10, max_size=64))
+
+
+@pytest.mark.parametrize(
+    "sizes", [SIZES, {"min_size": 1, "avg_size": 2, "max_size": 8}]
+)
+def test_numpy_matches_pure_python(sizes, monkeypatch):
+    """Test NumPy finds the same boundaries as the pure Python fallback."""
+    pytest.importorskip("numpy")
+    data = _data(200000, seed=3)
+    accelerated = iter_chunks(BytesIO(data), chunksize=70000, **sizes)
+    expected = [(c.offset, c.length) for c in accelerated]
+    monkeypatch.setattr(chunking, "_numpy", lambda: None)
+    fallback = iter_chunks(BytesIO(data), chunksize=70000, **sizes)
+    assert [(c.offset, c.length) for c in fallback] == expected
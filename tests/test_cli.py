@@ -1,9 +1,31 @@
 """Test the minimal CLI."""
 
+import gzip
+import hashlib
+import json
+import os
+import zipfile
 from json import dumps
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import Thread
 
-from multihash.cli import build_parser, compute, print_results
+import pytest
+
+from multihash.cli import (
+    build_known_index,
+    build_parser,
+    check,
+    cli,
+    compute,
+    coordinate,
+    filter_known,
+    follow,
+    print_results,
+    worker,
+)
+from multihash.daemon import HashDaemon
+from multihash.known import KnownHashIndex
+from multihash.memory import memory_usage, set_memory_budget
 
 
 def test_json_output(capsys):  # or use "capfd" for fd-level
@@ -31,3 +53,296 @@ def test_compute():
         == "524d7edddd0f6e364120af132ce1100d4200246aecb2540519d8280c648f026b"
     )
     assert result[tmp_name]["md5"] == "6108e0aae2f7a4d18da546f3c66d23b0"
+
+
+def test_compute_archive():
+    """Test the computation the CLI does for archive members."""
+    with NamedTemporaryFile(suffix=".zip") as temp:
+        with zipfile.ZipFile(temp, "w") as archive:
+            archive.writestr("member.txt", b"This is some test data.\n")
+        temp.flush()
+        result = compute([temp.name], ["md5"], 512, archive=True)
+        assert result == {
+            temp.name: {"member.txt": {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}}
+        }
+
+
+def test_compute_decompressed():
+    """Test the computation the CLI does for compressed files."""
+    compressed = gzip.compress(b"This is some test data.\n")
+    with NamedTemporaryFile(suffix=".gz") as temp:
+        temp.write(compressed)
+        temp.flush()
+        result = compute([temp.name], ["md5"], 512, decompress="auto")
+        assert result == {temp.name: {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}}
+        result = compute([temp.name], ["md5"], 512, decompress="gzip", raw=True)
+    assert result[temp.name]["content"] == {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}
+    assert result[temp.name]["raw"] == {"md5": hashlib.md5(compressed).hexdigest()}
+
+
+def test_decompress_max_memory(capsys, monkeypatch):
+    """Test --decompress runs within --max-memory."""
+    with NamedTemporaryFile(suffix=".gz") as temp:
+        temp.write(gzip.compress(b"This is some test data.\n"))
+        temp.flush()
+        argv = ["multihash", "--max-memory", "256KiB", "--decompress", "-a", "md5"]
+        monkeypatch.setattr("sys.argv", argv + [temp.name])
+        try:
+            cli()
+        finally:
+            set_memory_budget(None)
+    assert json.loads(capsys.readouterr().out) == {
+        temp.name: {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}
+    }
+    assert memory_usage() == 0
+
+
+def test_coordinate_and_worker(capsys):
+    """Test the coordinate and worker commands hash files together."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data")
+        with open(path, "wb") as file_object:
+            file_object.write(b"This is some test data.\n")
+        address = "unix:" + os.path.join(directory, "coordinator.sock")
+        # The worker retries connecting until the coordinator is listening
+        thread = Thread(target=worker, args=(["--connect", address],))
+        thread.start()
+        coordinate(["--listen", address, "-a", "md5", path])
+        thread.join()
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {
+        path: {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}
+    }
+
+
+def test_daemon(capsys, monkeypatch):
+    """Test filepaths are forwarded to a daemon given by the environment."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data")
+        with open(path, "wb") as file_object:
+            file_object.write(b"This is some test data.\n")
+        socket_path = os.path.join(directory, "daemon.sock")
+        monkeypatch.setenv("MULTIHASH_DAEMON", socket_path)
+        monkeypatch.setattr("sys.argv", ["multihash", "-a", "md5", path])
+        with HashDaemon(socket_path):
+            cli()
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {
+        path: {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}
+    }
+
+
+@pytest.mark.parametrize("output_format", ["json", "binary"])
+def test_daemon_errors(output_format, capsys, monkeypatch):
+    """Test files the daemon couldn't hash fail the command, as they would here."""
+    with TemporaryDirectory() as directory:
+        missing = os.path.join(directory, "missing")
+        socket_path = os.path.join(directory, "daemon.sock")
+        monkeypatch.setenv("MULTIHASH_DAEMON", socket_path)
+        argv = ["multihash", "-a", "md5", "--format", output_format, missing]
+        monkeypatch.setattr("sys.argv", argv + [__file__])
+        with HashDaemon(socket_path):
+            with pytest.raises(SystemExit) as exit_info:
+                cli()
+    assert exit_info.value.code == 1
+    captured = capsys.readouterr()
+    assert missing in captured.err and "FileNotFoundError" in captured.err
+    assert not captured.out
+
+
+def test_daemon_fallback(capsys, monkeypatch):
+    """Test files are hashed here if the daemon in the environment isn't usable."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data")
+        with open(path, "wb") as file_object:
+            file_object.write(b"This is some test data.\n")
+        socket_path = os.path.join(directory, "daemon.sock")
+        monkeypatch.setenv("MULTIHASH_DAEMON", socket_path)
+        for options in ([], ["--workers", "2"]):
+            monkeypatch.setattr("sys.argv", ["multihash", "-a", "md5", path] + options)
+            cli()
+            assert json.loads(capsys.readouterr().out) == {
+                path: {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}
+            }
+        argv = ["multihash", "--daemon", socket_path, "-a", "md5", path]
+        for options in ([], ["--max-memory", "1MiB"]):
+            monkeypatch.setattr("sys.argv", argv + options)
+            with pytest.raises(SystemExit) as exit_info:
+                cli()
+            assert exit_info.value.code
+
+
+def test_filter_known():
+    """Test known digests are suppressed or flagged, including nested ones."""
+    index = KnownHashIndex.from_digests(["6108e0aae2f7a4d18da546f3c66d23b0"])
+    results = {
+        "known": {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"},
+        "unknown": {"md5": "ce114e4501d2f4e2dcea3e17b546f339"},
+        "archive": {"member": {"md5": "6108e0aae2f7a4d18da546f3c66d23b0"}},
+    }
+    assert filter_known(results, index, "md5") == {
+        "unknown": {"md5": "ce114e4501d2f4e2dcea3e17b546f339"},
+        "archive": {},
+    }
+    flagged = filter_known(results, index, "md5", action="flag")
+    assert flagged["known"] == {
+        "md5": "6108e0aae2f7a4d18da546f3c66d23b0",
+        "known": True,
+    }
+    assert flagged["archive"]["member"]["known"] is True
+    assert "known" not in flagged["unknown"]
+
+
+def test_build_known_index():
+    """Test the build-known-index command saves an index --known can load."""
+    with TemporaryDirectory() as directory:
+        digests = os.path.join(directory, "known.txt")
+        with open(digests, "w") as hexfile:
+            hexfile.write("6108e0aae2f7a4d18da546f3c66d23b0  data\n")
+        path = os.path.join(directory, "known.idx")
+        build_known_index([digests, path])
+        index = KnownHashIndex.load(path, use_mmap=False)
+    assert "6108e0aae2f7a4d18da546f3c66d23b0" in index
+    assert index.bloom is not None
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        ["--known-algo", "sha1", "-a", "md5"],
+        ["--known-algo", "nonsense", "-a", "md5"],
+        ["--known-action", "flag", "--format", "binary", "-a", "md5"],
+        [],
+    ],
+)
+def test_known_arguments_refused(arguments, monkeypatch, capsys):
+    """Test --known settings which couldn't filter anything are refused."""
+    argv = ["multihash", "--known", "known.txt"] + arguments + [__file__]
+    monkeypatch.setattr("sys.argv", argv)
+    with pytest.raises(SystemExit):
+        cli()
+    assert "error" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "arguments, message",
+    [
+        (["--archive", "--decompress"], "--archive can't be combined"),
+        (["--raw"], "--raw requires --decompress"),
+        (["--archive", "--raw"], "--raw requires --decompress"),
+    ],
+)
+def test_compression_arguments_refused(arguments, message, monkeypatch, capsys):
+    """Test options which would be silently ignored are refused."""
+    monkeypatch.setattr("sys.argv", ["multihash", "-a", "md5", __file__] + arguments)
+    with pytest.raises(SystemExit):
+        cli()
+    assert message in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("contents", [None, "not a hex digest\n"])
+def test_known_refused_before_hashing(contents, monkeypatch, capsys):
+    """Test a missing or malformed --known file is reported before hashing."""
+    with TemporaryDirectory() as directory:
+        known = os.path.join(directory, "known.txt")
+        if contents is not None:
+            with open(known, "w") as hexfile:
+                hexfile.write(contents)
+        argv = ["multihash", "-a", "md5", "--known", known, __file__]
+        monkeypatch.setattr("sys.argv", argv)
+        monkeypatch.setattr("multihash.cli.compute", pytest.fail)
+        with pytest.raises(SystemExit):
+            cli()
+    assert "--known" in capsys.readouterr().err
+
+
+def test_known_cli(monkeypatch, capsys):
+    """Test --known compares the right digests, whatever case algos are in."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data")
+        with open(path, "wb") as file_object:
+            file_object.write(b"This is some test data.\n")
+        digests = os.path.join(directory, "known.txt")
+        with open(digests, "w") as hexfile:
+            hexfile.write(hashlib.sha256(b"This is some test data.\n").hexdigest())
+        argv = ["multihash", "-a", "MD5", "-a", "s3etag:5", "-a", "SHA256"]
+        argv += ["--known", digests, path]
+        monkeypatch.setattr("sys.argv", argv + ["--known-algo", "sha256"])
+        cli()
+        assert json.loads(capsys.readouterr().out) == {}
+        # Multipart ETags aren't hex digests, so are never known
+        monkeypatch.setattr("sys.argv", argv + ["--known-algo", "s3etag:5"])
+        cli()
+        assert list(json.loads(capsys.readouterr().out)) == [path]
+
+
+@pytest.mark.parametrize("output_format", ["json", "binary"])
+def test_check(output_format, capsysbinary):
+    """Test checking files against JSON and binary manifests."""
+    with TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ("a", "b", "c")]
+        for path in paths:
+            with open(path, "wb") as file_object:
+                file_object.write(path.encode())
+        print_results(compute(paths, ["md5", "crc32"], 512), output_format)
+        manifest = os.path.join(directory, "manifest")
+        with open(manifest, "wb") as file_object:
+            file_object.write(capsysbinary.readouterr().out)
+        with open(paths[1], "ab") as file_object:
+            file_object.write(b"changed")
+        os.unlink(paths[2])
+        report = check(manifest, 512)
+    assert report[paths[0]] == "ok"
+    assert report[paths[1]] == "mismatch"
+    assert report[paths[2]].startswith("error")
+
+
+def test_check_unverifiable(monkeypatch):
+    """Test entries with nothing to compare, and empty manifests, fail."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "archive.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("member.txt", b"This is some test data.\n")
+        manifest = os.path.join(directory, "manifest.json")
+        with open(manifest, "w") as file_object:
+            file_object.write(dumps(compute([path], ["md5"], 512, archive=True)))
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("member.txt", b"Tampered.\n")
+        assert check(manifest, 512) == {path: "error: no digests to check"}
+        with open(manifest, "w") as file_object:
+            file_object.write(dumps({path: {"error": "Not hashed"}, "x": []}))
+        assert check(manifest, 512) == {
+            path: "error: Not hashed",
+            "x": "error: no digests to check",
+        }
+        with open(manifest, "w") as file_object:
+            file_object.write(dumps({path: {"nonsense": "00"}}))
+        assert check(manifest, 512)[path].startswith("error: unsupported")
+        for entries in ({path: {"md5": "00"}}, {}):
+            with open(manifest, "w") as file_object:
+                file_object.write(dumps(entries))
+            monkeypatch.setattr("sys.argv", ["multihash", "--check", manifest])
+            with pytest.raises(SystemExit) as exit_info:
+                cli()
+            assert exit_info.value.code != 0
+
+
+def test_follow():
+    """Test following prints a record only when a file changes."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "log")
+        with open(path, "wb") as file_object:
+            file_object.write(b"first")
+        records = follow([path], ["md5"], 512, interval=0)
+        assert next(records)["digests"]["md5"] == hashlib.md5(b"first").hexdigest()
+        with open(path, "ab") as file_object:
+            file_object.write(b"second")
+        record = next(records)
+        assert record["offset"] == 11
+        assert record["digests"]["md5"] == hashlib.md5(b"firstsecond").hexdigest()
+        os.unlink(path)
+        assert "error" in next(records)
+        with open(path, "wb") as file_object:
+            file_object.write(b"new")
+        record = next(records)
+        assert record["digests"]["md5"] == hashlib.md5(b"new").hexdigest()
@@ -0,0 +1,120 @@
+"""Tests for hashing decompressed content."""
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+from os import urandom
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from multihash import MultiHash
+from multihash.compression import detect, hash_decompressed
+from multihash.memory import MIN_CHUNKSIZE, memory_usage, set_memory_budget
+
+DATA = urandom(1024 * 100)
+COMPRESSED = {
+    "gzip": gzip.compress(DATA),
+    "bz2": bz2.compress(DATA),
+    "xz": lzma.compress(DATA),
+}
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSED))
+def test_detect(compression):
+    """Test formats are recognized from their leading bytes."""
+    assert detect(COMPRESSED[compression][:6]) == compression
+    assert detect(b"plain text") is None
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSED))
+@pytest.mark.parametrize("declared", ["auto", None])
+def test_hash_decompressed(compression, declared):
+    """Test content and raw digests both come from one pass."""
+    compressed = COMPRESSED[compression]
+    content, raw = hash_decompressed(
+        io.BytesIO(compressed),
+        hashers=["md5", "sha256"],
+        raw_hashers=["sha256"],
+        compression=declared or compression,
+        chunksize=4096,
+    )
+    assert content.hexdigest() == {
+        "md5": hashlib.md5(DATA).hexdigest(),
+        "sha256": hashlib.sha256(DATA).hexdigest(),
+    }
+    assert raw.hexdigest() == {"sha256": hashlib.sha256(compressed).hexdigest()}
+
+
+def test_multiple_members():
+    """Test concatenated gzip members are all decompressed."""
+    compressed = gzip.compress(b"first ") + gzip.compress(b"second")
+    content, raw = hash_decompressed(io.BytesIO(compressed), hashers=["md5"])
+    assert content.hexdigest() == {"md5": hashlib.md5(b"first second").hexdigest()}
+    assert raw is None
+
+
+def test_uncompressed_passthrough():
+    """Test unrecognized inputs are hashed as they are when auto detecting."""
+    content, raw = hash_decompressed(
+        io.BytesIO(DATA), hashers=["md5"], raw_hashers=["md5"], chunksize=1000
+    )
+    assert content.hexdigest() == raw.hexdigest() == {
+        "md5": hashlib.md5(DATA).hexdigest()
+    }
+
+
+def test_corrupt_input():
+    """Test decompression errors are raised to the caller."""
+    with pytest.raises((OSError, EOFError)):
+        hash_decompressed(io.BytesIO(COMPRESSED["gzip"][:-100]), hashers=["md5"])
+
+
+def test_unsupported_compression():
+    """Test unknown formats are refused."""
+    with pytest.raises(ValueError):
+        hash_decompressed(io.BytesIO(b""), compression="zstd")
+
+
+def test_from_filepath_decompress():
+    """Test the decompress option of from_filepath."""
+    with NamedTemporaryFile(suffix=".xz") as temp:
+        temp.write(COMPRESSED["xz"])
+        temp.flush()
+        result = MultiHash.from_filepath(temp.name, hashers=["md5"], decompress="auto")
+        assert result.hexdigest() == {"md5": hashlib.md5(DATA).hexdigest()}
+        with pytest.raises(ValueError):
+            MultiHash.from_filepath(temp.name, decompress="xz", offset=10)
+
+
+def test_memory_budget():
+    """Test decompressed chunks shrink to fit the process wide budget."""
+    sizes = []
+
+    class Spy:
+        """A hasher recording the budget's usage as it's updated."""
+
+        name = "spy"
+
+        def update(self, chunk):
+            """Record the usage, and the chunk size."""
+            sizes.append((memory_usage(), len(chunk)))
+
+        def hexdigest(self):
+            """Produce no hexdigest."""
+            return ""
+
+    set_memory_budget(MIN_CHUNKSIZE * 4)
+    try:
+        content, _ = hash_decompressed(
+            io.BytesIO(COMPRESSED["gzip"]),
+            hashers=["md5", Spy()],
+            chunksize=1048576,
+        )
+    finally:
+        set_memory_budget(None)
+    assert content.hexdigest()["md5"] == hashlib.md5(DATA).hexdigest()
+    assert all(used == MIN_CHUNKSIZE * 4 for used, _ in sizes)
+    assert max(size for _, size in sizes) == MIN_CHUNKSIZE
+    assert memory_usage() == 0
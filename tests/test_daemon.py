@@ -0,0 +1,53 @@
+"""Tests for the hashing daemon."""
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from multihash.daemon import HashDaemon, request
+
+
+@pytest.fixture
+def directory():
+    """Return a directory holding a short socket path and some files."""
+    with TemporaryDirectory() as tmpdir:
+        for name in ("a", "b"):
+            with open(os.path.join(tmpdir, name), "wb") as file_object:
+                file_object.write(name.encode() * 1000)
+        yield tmpdir
+
+
+def test_request(directory):
+    """Files are hashed by the daemon, and errors reported per file."""
+    socket_path = os.path.join(directory, "sock")
+    paths = [os.path.join(directory, name) for name in ("a", "b", "missing")]
+    with HashDaemon(socket_path, workers=2):
+        for _ in range(2):
+            results = request(socket_path, paths, ["md5", "crc32"])
+            assert results[paths[0]]["md5"] == hashlib.md5(b"a" * 1000).hexdigest()
+            assert results[paths[1]]["md5"] == hashlib.md5(b"b" * 1000).hexdigest()
+            assert results[paths[2]]["error"].startswith("FileNotFoundError")
+        with pytest.raises(ValueError):
+            request(socket_path, paths, ["nonexistent"])
+    assert not os.path.exists(socket_path)
+
+
+def test_relative_paths(directory, monkeypatch):
+    """Relative paths are resolved by the client, and reported as given."""
+    socket_path = os.path.join(directory, "sock")
+    monkeypatch.chdir(directory)
+    with HashDaemon(socket_path):
+        results = request(socket_path, ["a"], ["sha1"])
+    assert results == {"a": {"sha1": hashlib.sha1(b"a" * 1000).hexdigest()}}
+
+
+def test_stale_socket(directory):
+    """A socket left behind by a daemon which died is replaced."""
+    socket_path = os.path.join(directory, "sock")
+    HashDaemon(socket_path)._bind().server_close()
+    assert os.path.exists(socket_path)
+    with HashDaemon(socket_path):
+        with pytest.raises(OSError):
+            HashDaemon(socket_path).start()
+        assert request(socket_path, [os.path.join(directory, "a")])
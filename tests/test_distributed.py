@@ -0,0 +1,190 @@
+"""Tests for distributed hashing, with workers on localhost."""
+import hashlib
+import os
+import socket
+import time
+from os import urandom
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+import pytest
+
+from multihash import distributed
+from multihash.distributed import (
+    Coordinator,
+    WorkUnit,
+    parse_address,
+    plan,
+    receive_message,
+    run_worker,
+    send_message,
+)
+
+
+@pytest.fixture
+def files():
+    """Create some files to hash."""
+    with TemporaryDirectory() as directory:
+        contents = {}
+        for index in range(5):
+            path = os.path.join(directory, "file{}".format(index))
+            contents[path] = urandom(1000 * (index + 1))
+            with open(path, "wb") as file_object:
+                file_object.write(contents[path])
+        yield contents
+
+
+def _start_workers(address, count):
+    """Start worker threads connecting to a coordinator."""
+    threads = [Thread(target=run_worker, args=(address,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_parse_address():
+    """Test parsing TCP and Unix socket addresses."""
+    assert parse_address("localhost:8000") == ("localhost", 8000)
+    assert parse_address(":0") == ("localhost", 0)
+    assert parse_address("[::1]:80") == ("::1", 80)
+    assert parse_address("unix:/tmp/multihash.sock") == "/tmp/multihash.sock"
+    with pytest.raises(ValueError):
+        parse_address("localhost")
+
+
+def test_plan(files):
+    """Test splitting files into byte range work units."""
+    path = sorted(files)[2]  # 3000 bytes
+    assert plan([path]) == [WorkUnit(path)]
+    assert plan([path], split_size=1024) == [
+        WorkUnit(path, 0, 1024),
+        WorkUnit(path, 1024, 1024),
+        WorkUnit(path, 2048, 952),
+    ]
+
+
+def test_tcp_workers(files):
+    """Test several workers hashing files for a TCP coordinator."""
+    coordinator = Coordinator("localhost:0", sorted(files), algos=["md5", "sha256"])
+    threads = _start_workers(coordinator.start(), 3)
+    manifest = coordinator.wait(timeout=30)
+    for thread in threads:
+        thread.join()
+    assert manifest == {
+        path: {
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        for path, data in files.items()
+    }
+
+
+def test_unix_workers_split(files):
+    """Test byte range work units over a Unix socket."""
+    path = sorted(files)[-1]  # 5000 bytes
+    with TemporaryDirectory() as directory:
+        address = "unix:" + os.path.join(directory, "coordinator.sock")
+        coordinator = Coordinator(address, [path], algos=["md5"], split_size=2048)
+        threads = _start_workers(coordinator.start(), 2)
+        manifest = coordinator.wait(timeout=30)
+        for thread in threads:
+            thread.join()
+    pieces = [files[path][offset : offset + 2048] for offset in (0, 2048, 4096)]
+    assert manifest == {
+        path: [
+            {
+                "offset": index * 2048,
+                "length": len(piece),
+                "digests": {"md5": hashlib.md5(piece).hexdigest()},
+            }
+            for index, piece in enumerate(pieces)
+        ]
+    }
+
+
+def test_retries_after_worker_disconnects(files):
+    """Test a unit abandoned by a worker is handed to another."""
+    coordinator = Coordinator("localhost:0", sorted(files)[:1], algos=["md5"])
+    host, port = parse_address(coordinator.start())
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rwb")
+        send_message(stream, {"type": "hello"})
+        assert receive_message(stream)["type"] == "work"
+        stream.close()
+    threads = _start_workers(coordinator.address, 1)
+    manifest = coordinator.wait(timeout=30)
+    threads[0].join()
+    path, data = sorted(files.items())[0]
+    assert manifest == {path: {"md5": hashlib.md5(data).hexdigest()}}
+
+
+def test_errors_recorded_after_attempts(files):
+    """Test units which keep failing are recorded as errors."""
+    missing = os.path.join(os.path.dirname(sorted(files)[0]), "missing")
+    coordinator = Coordinator("localhost:0", [missing], max_attempts=2)
+    threads = _start_workers(coordinator.start(), 1)
+    manifest = coordinator.wait(timeout=30)
+    threads[0].join()
+    assert manifest[missing]["error"].startswith("FileNotFoundError")
+
+
+@pytest.mark.parametrize(
+    "reply", [["not", "a", "dict"], {"type": "result"}, {"type": "unknown"}]
+)
+def test_retries_after_invalid_reply(files, reply):
+    """Test a malformed reply requeues the unit, rather than stopping the server."""
+    coordinator = Coordinator("localhost:0", sorted(files)[:1], algos=["md5"])
+    host, port = parse_address(coordinator.start())
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rwb")
+        send_message(stream, {"type": "hello"})
+        assert receive_message(stream)["type"] == "work"
+        send_message(stream, reply)
+        assert receive_message(stream) is None
+        stream.close()
+    threads = _start_workers(coordinator.address, 1)
+    manifest = coordinator.wait(timeout=30)
+    threads[0].join()
+    path, data = sorted(files.items())[0]
+    assert manifest == {path: {"md5": hashlib.md5(data).hexdigest()}}
+
+
+def test_invalid_replies_recorded_after_attempts(files):
+    """Test a unit which only gets malformed replies is recorded as an error."""
+    coordinator = Coordinator("localhost:0", sorted(files)[:1], max_attempts=1)
+    host, port = parse_address(coordinator.start())
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rwb")
+        send_message(stream, {"type": "hello"})
+        receive_message(stream)
+        send_message(stream, {"type": "result", "digests": None})
+        manifest = coordinator.wait(timeout=30)
+        stream.close()
+    assert manifest[sorted(files)[0]]["error"].startswith("Invalid reply")
+
+
+def test_worker_reconnects_after_timeout(files, monkeypatch):
+    """Test a worker whose reply timed out reconnects, rather than exiting."""
+    hash_unit = distributed._hash_unit
+    delays = [1.0]
+
+    def slow_hash_unit(message):
+        """Take longer than the timeout to hash the first unit."""
+        if delays:
+            time.sleep(delays.pop())
+        return hash_unit(message)
+
+    monkeypatch.setattr(distributed, "_hash_unit", slow_hash_unit)
+    paths = sorted(files)[:2]
+    coordinator = Coordinator("localhost:0", paths, algos=["md5"], timeout=0.2)
+    results = []
+    worker = Thread(
+        target=lambda: results.append(run_worker(coordinator.start())), daemon=True
+    )
+    worker.start()
+    manifest = coordinator.wait(timeout=10)
+    worker.join(timeout=10)
+    assert manifest == {
+        path: {"md5": hashlib.md5(files[path]).hexdigest()} for path in paths
+    }
+    assert results and results[0] >= 2
@@ -0,0 +1,148 @@
+"""Tests for hashing many files."""
+import hashlib
+import os
+import time
+from collections import Counter
+from os import urandom
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+
+import pytest
+
+from multihash import MultiHash, engine
+from multihash.engine import hash_file, hash_files
+
+
+class _Deferred:
+    """A hasher which keeps its input, and only hashes it when asked."""
+
+    name = "deferred"
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self):
+        """Start with no input."""
+        self.chunks = []
+
+    def update(self, data):
+        """Keep the data."""
+        self.chunks.append(data)
+
+    def digest(self):
+        """Hash everything kept so far."""
+        return hashlib.sha256(b"".join(self.chunks)).digest()
+
+    def hexdigest(self):
+        """Hash everything kept so far, as hex."""
+        return self.digest().hex()
+
+    def copy(self):
+        """Copy the kept input."""
+        clone = _Deferred()
+        clone.chunks = list(self.chunks)
+        return clone
+
+
+@pytest.fixture
+def tree():
+    """Create files either side of the small file size."""
+    with TemporaryDirectory() as tmpdir:
+        paths = {}
+        for size in (0, 1, 100, 65535, 65536, 65537, 300000):
+            path = os.path.join(tmpdir, str(size))
+            data = urandom(size)
+            with open(path, "wb") as file:
+                file.write(data)
+            paths[path] = data
+        yield paths
+
+
+def test_hash_file(tree):
+    """Small and large files match hashlib."""
+    prototype = MultiHash(hashers=["md5", "sha256"])
+    for path, data in tree.items():
+        digests = hash_file(path, prototype, chunksize=4096).hexdigest()
+        assert digests["md5"] == hashlib.md5(data).hexdigest()
+        assert digests["sha256"] == hashlib.sha256(data).hexdigest()
+    # The prototype is never updated
+    assert prototype.hexdigest()["md5"] == hashlib.md5().hexdigest()
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="Requires FIFOs")
+def test_hash_fifo():
+    """Pipes are read to the end, rather than sized and seeked."""
+    data = urandom(300000)
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "fifo")
+        os.mkfifo(path)
+
+        def write():
+            """Write the data into the FIFO."""
+            with open(path, "wb") as fifo:
+                fifo.write(data)
+
+        writer = Thread(target=write)
+        writer.start()
+        digests = hash_file(path, MultiHash(hashers=["md5"]), 4096).hexdigest()
+        writer.join()
+    assert digests["md5"] == hashlib.md5(data).hexdigest()
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_hash_files(tree, max_workers):
+    """Results come back in order, matching hashlib."""
+    paths = sorted(tree) * 5
+    results = list(hash_files(paths, hashers=["sha1"], max_workers=max_workers))
+    assert [path for path, _ in results] == paths
+    for path, multihash in results:
+        assert multihash.hexdigest()["sha1"] == hashlib.sha1(tree[path]).hexdigest()
+
+
+def test_hashers_may_keep_data(tree):
+    """Hashers which keep what they're given still see each file's own data."""
+    results = list(hash_files(sorted(tree), hashers=[_Deferred()], chunksize=4096))
+    for path, multihash in results:
+        expected = hashlib.sha256(tree[path]).hexdigest()
+        assert multihash.hexdigest()["deferred"] == expected
+
+
+def test_hash_files_error(tree):
+    """Errors are raised for the file which caused them."""
+    paths = sorted(tree) + ["/does/not/exist"]
+    with pytest.raises(FileNotFoundError):
+        list(hash_files(paths, max_workers=4))
+    with pytest.raises(FileNotFoundError):
+        list(hash_files(paths, max_workers=4, per_device=2))
+
+
+def test_per_device(tree, monkeypatch):
+    """Devices are limited and take turns, and results stay in order."""
+    paths = sorted(tree) * 4
+    devices = {path: index % 2 for index, path in enumerate(sorted(tree))}
+    monkeypatch.setattr(engine, "_device", devices.get)
+    lock = Lock()
+    active = Counter()
+    peaks = Counter()
+    started = []
+    original = engine.hash_file
+
+    def tracking_hash_file(path, *args):
+        """Record how many files are hashed at once on each device."""
+        with lock:
+            active[devices[path]] += 1
+            peaks[devices[path]] = max(peaks[devices[path]], active[devices[path]])
+            started.append(devices[path])
+        try:
+            time.sleep(0.01)
+            return original(path, *args)
+        finally:
+            with lock:
+                active[devices[path]] -= 1
+
+    monkeypatch.setattr(engine, "hash_file", tracking_hash_file)
+    results = list(hash_files(paths, hashers=["md5"], max_workers=4, per_device=1))
+    assert [path for path, _ in results] == paths
+    for path, multihash in results:
+        assert multihash.hexdigest()["md5"] == hashlib.md5(tree[path]).hexdigest()
+    assert peaks == {0: 1, 1: 1}
+    assert started[:2] in ([0, 1], [1, 0])
@@ -0,0 +1,110 @@
+"""Tests for the long lived hashing executor."""
+import hashlib
+import os
+from io import BytesIO
+from queue import Full
+from tempfile import TemporaryDirectory
+from threading import Event
+
+import pytest
+
+from multihash.executor import HIGH, LOW, MultiHashExecutor
+from multihash.memory import MemoryBudget
+
+
+class BlockingStream(BytesIO):
+    """A stream whose first read waits for an event."""
+
+    def __init__(self, data, event):
+        """Wrap some data."""
+        super().__init__(data)
+        self.event = event
+
+    def read(self, size=-1):
+        """Wait for the event, then read."""
+        self.event.wait()
+        return super().read(size)
+
+
+def test_sources():
+    """Paths, streams and buffers are all hashed."""
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "file")
+        with open(path, "wb") as file_object:
+            file_object.write(b"path data")
+        with MultiHashExecutor(hashers=["md5"], chunksize=4) as executor:
+            futures = [
+                executor.submit(path),
+                executor.submit(BytesIO(b"stream data")),
+                executor.submit(bytearray(b"buffer data")),
+                executor.submit(b"other", hashers=["sha1"]),
+            ]
+            results = [future.result().hexdigest() for future in futures]
+    assert results[0]["md5"] == hashlib.md5(b"path data").hexdigest()
+    assert results[1]["md5"] == hashlib.md5(b"stream data").hexdigest()
+    assert results[2]["md5"] == hashlib.md5(b"buffer data").hexdigest()
+    assert results[3] == {"sha1": hashlib.sha1(b"other").hexdigest()}
+    assert executor.inflight_bytes == 0
+
+
+def test_errors():
+    """Errors are set on the submission's future."""
+    with MultiHashExecutor(hashers=["md5"]) as executor:
+        future = executor.submit("/does/not/exist")
+        with pytest.raises(FileNotFoundError):
+            future.result()
+    with pytest.raises(RuntimeError):
+        executor.submit(b"too late")
+
+
+def test_priority_and_backpressure():
+    """Waiting submissions run in priority order, and a full queue blocks."""
+    event = Event()
+    executor = MultiHashExecutor(hashers=["md5"], max_workers=1, max_queued=2)
+    finished = []
+    blocker = executor.submit(BlockingStream(b"blocking", event))
+    # Wait for the worker to take the blocking stream off the queue
+    while executor._queue.qsize():
+        pass
+    low = executor.submit(b"low", priority=LOW)
+    high = executor.submit(b"high", priority=HIGH)
+    low.add_done_callback(lambda _: finished.append("low"))
+    high.add_done_callback(lambda _: finished.append("high"))
+    with pytest.raises(Full):
+        executor.submit(b"no room", timeout=0.01)
+    event.set()
+    executor.shutdown()
+    assert blocker.result().hexdigest()["md5"] == hashlib.md5(b"blocking").hexdigest()
+    assert finished == ["high", "low"]
+
+
+def test_byte_budget():
+    """Submissions wait for room in the byte budget, and may be cancelled."""
+    event = Event()
+    executor = MultiHashExecutor(
+        hashers=["md5"], max_workers=1, max_inflight_bytes=16, chunksize=8
+    )
+    executor.submit(BlockingStream(b"blocking", event))
+    assert executor.inflight_bytes == 8
+    queued = executor.submit(b"12345678")
+    assert executor.inflight_bytes == 16
+    with pytest.raises(TimeoutError):
+        executor.submit(b"1", timeout=0.01)
+    executor.shutdown(wait=False, cancel_futures=True)
+    assert queued.cancelled()
+    event.set()
+    for thread in executor._threads:
+        thread.join()
+    assert executor.inflight_bytes == 0
+
+
+def test_shared_budget():
+    """A shared budget shrinks stream chunks to what's available."""
+    budget = MemoryBudget(200000)
+    budget.acquire(120000)
+    data = b"x" * 100000
+    executor = MultiHashExecutor(hashers=["md5"], chunksize=1000000, budget=budget)
+    with executor:
+        future = executor.submit(BytesIO(data))
+        assert future.result().hexdigest()["md5"] == hashlib.md5(data).hexdigest()
+    assert budget.used == 120000
@@ -0,0 +1,239 @@
+"""Tests for the additional hashers."""
+import hashlib
+import zlib
+from os import urandom
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from multihash import MultiHash, hashers
+from multihash.engine import hash_files
+from multihash.hashers import (
+    CRC32,
+    Adler32,
+    S3ETag,
+    TreeHash,
+    available,
+    format_size,
+    new,
+    parse_size,
+    register,
+)
+
+
+def _expected_etag(data, part_size):
+    """Compute a multipart ETag the slow way."""
+    parts = [data[i : i + part_size] for i in range(0, len(data), part_size)]
+    if len(parts) <= 1:
+        return hashlib.md5(data).hexdigest()
+    joined = b"".join(hashlib.md5(part).digest() for part in parts)
+    return "{}-{}".format(hashlib.md5(joined).hexdigest(), len(parts))
+
+
+def _expected_tree(data, leaf_size, algorithm="sha256"):
+    """Compute a tree hash the slow way."""
+    level = [
+        hashlib.new(algorithm, data[i : i + leaf_size]).digest()
+        for i in range(0, len(data), leaf_size)
+    ] or [hashlib.new(algorithm).digest()]
+    while len(level) > 1:
+        paired = [
+            hashlib.new(algorithm, b"".join(level[i : i + 2])).digest()
+            if len(level[i : i + 2]) == 2
+            else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        level = paired
+    return level[0]
+
+
+def test_parse_size():
+    """Test parsing human readable sizes."""
+    assert parse_size("512") == 512
+    assert parse_size("8MiB") == 8 * 1024 ** 2
+    assert parse_size("8M") == 8 * 1024 ** 2
+    assert parse_size("8mb") == 8 * 1000 ** 2
+    assert parse_size("1GiB") == 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size("eight megs")
+
+
+def test_format_size():
+    """Test formatting sizes round trips through parse_size."""
+    assert format_size(8 * 1024 ** 2) == "8MiB"
+    assert format_size(1000) == "1000"
+    assert parse_size(format_size(5 * 1024 ** 3)) == 5 * 1024 ** 3
+
+
+@pytest.mark.parametrize("size", [0, 100, 1024, 1025, 5000])
+def test_s3etag(size):
+    """Test the ETag matches a direct computation, across part boundaries."""
+    data = urandom(size)
+    hasher = S3ETag(part_size=1024)
+    hasher.update(data[:700])
+    hasher.update(data[700:])
+    assert hasher.hexdigest() == _expected_etag(data, 1024)
+
+
+def test_s3etag_copy():
+    """Test copies of an ETag hasher are independent."""
+    hasher = S3ETag(part_size=16, data=b"a" * 20)
+    clone = hasher.copy()
+    clone.update(b"b" * 20)
+    assert hasher.hexdigest() == _expected_etag(b"a" * 20, 16)
+    assert clone.hexdigest() == _expected_etag(b"a" * 20 + b"b" * 20, 16)
+
+
+def test_s3etag_by_name():
+    """Test requesting an ETag hasher by name in a MultiHash."""
+    data = urandom(3000)
+    result = MultiHash(data, hashers=["md5", "s3etag:1KiB"]).hexdigest()
+    assert result == {
+        "md5": hashlib.md5(data).hexdigest(),
+        "s3etag:1KiB": _expected_etag(data, 1024),
+    }
+    assert new("s3etag").name == "s3etag:8MiB"
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_s3etag_parallel(use_processes):
+    """Test hashing the parts of a file in parallel."""
+    data = urandom(10 * 1024 + 17)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        hasher = S3ETag.from_filepath(
+            test_file.name,
+            part_size=1024,
+            max_workers=3,
+            use_processes=use_processes,
+        )
+    assert hasher.hexdigest() == _expected_etag(data, 1024)
+    # The trailing part is still live
+    hasher.update(b"more")
+    assert hasher.hexdigest() == _expected_etag(data + b"more", 1024)
+
+
+@pytest.mark.parametrize("size", [0, 10, 64, 65, 64 * 5 + 3, 64 * 8])
+def test_tree_hash(size):
+    """Test the tree hash root matches a direct computation."""
+    data = urandom(size)
+    hasher = TreeHash(leaf_size=64, data=data)
+    assert hasher.digest() == _expected_tree(data, 64)
+    assert hasher.hexdigest() == _expected_tree(data, 64).hex()
+
+
+def test_tree_hash_pieces():
+    """Test the per-piece digests, as used for BitTorrent v1 piece hashes."""
+    data = urandom(1000)
+    hasher = TreeHash(leaf_size=256, algorithm="sha1", data=data)
+    assert hasher.piece_digests() == [
+        hashlib.sha1(data[i : i + 256]).digest() for i in range(0, 1000, 256)
+    ]
+    assert hasher.digest_size == 20
+
+
+def test_tree_hash_by_name():
+    """Test requesting tree hashers by name."""
+    assert new("treehash").name == "treehash:1MiB"
+    hasher = new("treehash-sha1:256KiB")
+    assert hasher.name == "treehash-sha1:256KiB"
+    assert hasher.piece_size == 256 * 1024
+    data = urandom(300)
+    result = MultiHash(data, hashers=["treehash:128"]).digest()
+    assert result == {"treehash:128": _expected_tree(data, 128)}
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_tree_hash_parallel(use_processes):
+    """Test hashing the leaves of a file in parallel."""
+    data = urandom(64 * 33 + 5)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        hasher = TreeHash.from_filepath(
+            test_file.name,
+            leaf_size=64,
+            algorithm="sha512",
+            max_workers=4,
+            use_processes=use_processes,
+        )
+    assert hasher.digest() == _expected_tree(data, 64, "sha512")
+
+
+def test_piece_hashers_in_parallel(monkeypatch):
+    """Test MultiHash and the engine digest pieces in parallel, if only pieced."""
+    calls = []
+    hash_ranges = hashers.hash_ranges
+
+    def spy(filepath, ranges, *args, **kwargs):
+        """Record the ranges digested in parallel."""
+        calls.append(len(ranges))
+        return hash_ranges(filepath, ranges, *args, **kwargs)
+
+    monkeypatch.setattr(hashers, "hash_ranges", spy)
+    data = urandom(100000)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        algos = ["treehash:4KiB", "s3etag:8KiB"]
+        result = MultiHash.from_filepath(test_file.name, hashers=algos).hexdigest()
+        ((_, multihash),) = hash_files([test_file.name], hashers=algos)
+        assert multihash.hexdigest() == result
+        assert sorted(calls) == [12, 12, 24, 24]
+        mixed = MultiHash.from_filepath(test_file.name, ["md5", "treehash:4KiB"])
+        assert len(calls) == 4
+    assert result == {
+        "treehash:4KiB": _expected_tree(data, 4096).hex(),
+        "s3etag:8KiB": _expected_etag(data, 8192),
+    }
+    assert mixed.hexdigest()["treehash:4KiB"] == result["treehash:4KiB"]
+
+
+def test_checksums():
+    """Test the zlib checksum hashers against zlib."""
+    data = urandom(5000)
+    crc = CRC32(data[:100])
+    crc.update(data[100:])
+    assert crc.hexdigest() == "{:08x}".format(zlib.crc32(data))
+    assert crc.digest() == zlib.crc32(data).to_bytes(4, "big")
+    adler = Adler32()
+    adler.update(data)
+    assert adler.digest() == zlib.adler32(data).to_bytes(4, "big")
+    clone = adler.copy()
+    clone.update(b"more")
+    assert adler.digest() == zlib.adler32(data).to_bytes(4, "big")
+    assert clone.digest() == zlib.adler32(data + b"more").to_bytes(4, "big")
+
+
+def test_checksums_by_name():
+    """Test requesting checksums by name in a MultiHash."""
+    result = MultiHash(b"This is a test", hashers=["crc32", "adler32"]).hexdigest()
+    assert result == {
+        "crc32": "{:08x}".format(zlib.crc32(b"This is a test")),
+        "adler32": "{:08x}".format(zlib.adler32(b"This is a test")),
+    }
+    assert {"crc32", "adler32", "md5", "s3etag"} <= available()
+
+
+def test_register():
+    """Test registering a custom hasher factory, with and without arguments."""
+
+    def factory(argument=None):
+        """Return a hasher whose name records the argument."""
+        hasher = CRC32()
+        hasher.name = "custom:{}".format(argument)
+        return hasher
+
+    register("custom", factory)
+    assert new("custom").name == "custom:None"
+    assert new("custom:foo").name == "custom:foo"
+    assert MultiHash(b"", hashers=["custom:bar"]).hexdigest() == {
+        "custom:bar": "00000000"
+    }
+
+
+def test_unknown_name():
+    """Test unknown names raise the same error as hashlib."""
+    with pytest.raises(ValueError):
+        new("not-a-real-algorithm")
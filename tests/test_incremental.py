@@ -0,0 +1,77 @@
+"""Tests for hashing append-only files incrementally."""
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from multihash.incremental import IncrementalFileHash
+
+
+@pytest.fixture
+def log_path():
+    """Return the path of a file to append to."""
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "log")
+        with open(path, "wb") as file_object:
+            file_object.write(b"hello")
+        yield path
+
+
+def append(path, data):
+    """Append some data to a file."""
+    with open(path, "ab") as file_object:
+        file_object.write(data)
+
+
+def test_appends(log_path):
+    """Only appended bytes are read, and snapshots leave the state untouched."""
+    tracker = IncrementalFileHash(log_path, hashers=["md5", "sha256"], chunksize=3)
+    assert tracker.refresh().hexdigest()["md5"] == hashlib.md5(b"hello").hexdigest()
+    assert tracker.offset == 5
+    append(log_path, b" world")
+    digests = tracker.refresh().hexdigest()
+    assert digests["sha256"] == hashlib.sha256(b"hello world").hexdigest()
+    assert tracker.offset == 11
+    assert not tracker.restarted
+    # Refreshing an unchanged file gives the same digests
+    assert tracker.refresh().hexdigest() == digests
+    assert tracker.snapshot().hexdigest() == digests
+
+
+def test_truncation(log_path):
+    """A truncated file is rehashed from the start."""
+    tracker = IncrementalFileHash(log_path, hashers=["md5"])
+    tracker.refresh()
+    with open(log_path, "wb") as file_object:
+        file_object.write(b"hi")
+    assert tracker.refresh().hexdigest()["md5"] == hashlib.md5(b"hi").hexdigest()
+    assert tracker.restarted
+    assert tracker.offset == 2
+
+
+def test_rotation(log_path):
+    """A file replaced by another is rehashed from the start."""
+    tracker = IncrementalFileHash(log_path, hashers=["md5"])
+    tracker.refresh()
+    os.rename(log_path, log_path + ".1")
+    with open(log_path, "wb") as file_object:
+        file_object.write(b"rotated, and longer")
+    digests = tracker.refresh().hexdigest()
+    assert digests["md5"] == hashlib.md5(b"rotated, and longer").hexdigest()
+    assert tracker.restarted
+
+
+def test_copytruncate(log_path):
+    """A file truncated then written past the old offset is rehashed."""
+    tracker = IncrementalFileHash(log_path, hashers=["md5"])
+    tracker.refresh()
+    with open(log_path, "r+b") as file_object:
+        file_object.truncate(0)
+        file_object.write(b"new content, longer than before")
+    digests = tracker.refresh().hexdigest()
+    assert digests["md5"] == hashlib.md5(b"new content, longer than before").hexdigest()
+    assert tracker.restarted
+    append(log_path, b"!")
+    tracker.refresh()
+    assert not tracker.restarted
@@ -0,0 +1,78 @@
+"""Tests for known digest indexes."""
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from multihash import known
+from multihash.known import BloomFilter, KnownHashIndex
+
+KNOWN = [hashlib.md5(str(i).encode()).digest() for i in range(1000)]
+UNKNOWN = [hashlib.md5(str(-i).encode()).digest() for i in range(1, 1000)]
+
+
+@pytest.mark.parametrize("bloom_error_rate", [0.01, None])
+def test_membership(bloom_error_rate):
+    """Test known digests are found and unknown ones aren't."""
+    index = KnownHashIndex.from_digests(KNOWN, bloom_error_rate=bloom_error_rate)
+    assert len(index) == len(KNOWN)
+    assert all(digest in index for digest in KNOWN)
+    assert not any(digest in index for digest in UNKNOWN)
+    assert KNOWN[5].hex() in index
+    assert b"short" not in index
+    assert KNOWN[5].hex() + "-3" not in index
+
+
+def test_bloom_filter_rate():
+    """Test the Bloom filter's false positive rate is about as requested."""
+    bloom = BloomFilter.for_capacity(len(KNOWN), 0.01)
+    for digest in KNOWN:
+        bloom.add(digest)
+    assert all(digest in bloom for digest in KNOWN)
+    assert sum(digest in bloom for digest in UNKNOWN) < len(UNKNOWN) * 0.05
+
+
+def test_sorted_in_runs(monkeypatch):
+    """Test records sorted in several runs are merged, without duplicates."""
+    monkeypatch.setattr(known, "_RUN_RECORDS", 7)
+    index = KnownHashIndex.from_digests(KNOWN + KNOWN[::3], bloom_error_rate=None)
+    assert len(index) == len(KNOWN)
+    assert [index._records[i] for i in range(len(index))] == sorted(KNOWN)
+    assert len(KnownHashIndex.from_digests([])) == 0
+
+
+def test_mixed_widths():
+    """Test digests of different sizes are refused."""
+    with pytest.raises(ValueError):
+        KnownHashIndex.from_digests([b"1234", b"12345"])
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_save_and_load(use_mmap):
+    """Test saved indexes load, memory-mapped or not."""
+    index = KnownHashIndex.from_digests(KNOWN)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "known.idx")
+        index.save(path)
+        loaded = KnownHashIndex.load(path, use_mmap=use_mmap)
+        assert len(loaded) == len(KNOWN)
+        assert loaded.width == 16
+        assert all(digest in loaded for digest in KNOWN)
+        assert not any(digest in loaded for digest in UNKNOWN)
+        assert len(KnownHashIndex.open(path)) == len(KNOWN)
+        with pytest.raises(ValueError):
+            KnownHashIndex.load(__file__)
+
+
+def test_from_hexfile():
+    """Test building an index from md5sum style output."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "known.txt")
+        with open(path, "w") as hexfile:
+            hexfile.write("# known good files\n\n")
+            for number, digest in enumerate(KNOWN):
+                hexfile.write("{}  file{}\n".format(digest.hex(), number))
+        index = KnownHashIndex.open(path)
+    assert len(index) == len(KNOWN)
+    assert KNOWN[-1] in index
@@ -0,0 +1,71 @@
+"""Tests for the binary manifest format."""
+import io
+import json
+from os import urandom
+
+import pytest
+
+from multihash import MultiHash
+from multihash.manifest import (
+    MAGIC,
+    ManifestWriter,
+    encode_varint,
+    read_manifest,
+    write_manifest,
+)
+
+
+def test_encode_varint():
+    """Test varints match the multiformats examples."""
+    assert encode_varint(1) == b"\x01"
+    assert encode_varint(127) == b"\x7f"
+    assert encode_varint(128) == b"\x80\x01"
+    assert encode_varint(255) == b"\xff\x01"
+    assert encode_varint(300) == b"\xac\x02"
+    assert encode_varint(16384) == b"\x80\x80\x01"
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+
+
+def test_round_trip():
+    """Test manifests read back what was written, including private codes."""
+    results = {
+        "file{}".format(i): MultiHash(
+            urandom(100), hashers=["md5", "sha256", "adler32", "s3etag:1KiB"]
+        ).digest()
+        for i in range(100)
+    }
+    stream = io.BytesIO()
+    write_manifest(stream, results)
+    stream.seek(0)
+    assert dict(read_manifest(stream)) == results
+
+
+def test_multihash_records():
+    """Test digest records are multiformats multihashes."""
+    digest = MultiHash(b"This is a test", hashers=["sha256"]).digest()
+    stream = io.BytesIO()
+    ManifestWriter(stream).write("a", digest)
+    expected = b"\x12\x20" + digest["sha256"]
+    assert stream.getvalue() == MAGIC + b"\x00\x01a\x01" + expected
+
+
+def test_smaller_than_json():
+    """Test binary manifests are much smaller than the JSON output."""
+    results = {
+        "file{}".format(i): MultiHash(urandom(10), hashers=["sha256"]).hexdigest()
+        for i in range(100)
+    }
+    stream = io.BytesIO()
+    write_manifest(stream, results)
+    assert len(stream.getvalue()) * 2 < len(json.dumps(results, indent=2))
+
+
+def test_invalid_manifests():
+    """Test bad or truncated manifests are refused."""
+    with pytest.raises(ValueError):
+        list(read_manifest(io.BytesIO(b"not a manifest")))
+    stream = io.BytesIO()
+    write_manifest(stream, {"a": {"md5": b"0123456789abcdef"}})
+    with pytest.raises(ValueError):
+        list(read_manifest(io.BytesIO(stream.getvalue()[:-3])))
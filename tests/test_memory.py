@@ -0,0 +1,101 @@
+"""Tests for the memory budget."""
+import hashlib
+from io import BytesIO
+from threading import Thread
+
+import pytest
+
+from multihash import MultiHash
+from multihash.memory import (
+    MemoryBudget,
+    get_memory_budget,
+    memory_usage,
+    set_memory_budget,
+)
+
+
+def test_unlimited():
+    """Without a limit, reservations are granted in full."""
+    budget = MemoryBudget()
+    assert budget.acquire(10 ** 12) == 10 ** 12
+    assert budget.used == 10 ** 12
+    assert budget.available is None
+    budget.release(10 ** 12)
+    assert budget.used == 0
+
+
+def test_shrink_and_wait():
+    """Reservations shrink to what's available, then wait for releases."""
+    budget = MemoryBudget(100)
+    assert budget.acquire(80) == 80
+    assert budget.acquire(80, minimum=10) == 20
+    assert budget.available == 0
+    with pytest.raises(TimeoutError):
+        budget.acquire(80, minimum=10, timeout=0.01)
+    granted = []
+    waiter = Thread(target=lambda: granted.append(budget.acquire(80, minimum=10)))
+    waiter.start()
+    budget.release(80)
+    waiter.join()
+    assert granted == [80]
+    budget.release(20)
+    budget.release(80)
+    # Reservations larger than the limit are granted once nothing is reserved
+    with budget.reserve(500) as size:
+        assert size == 500
+    assert budget.used == 0
+
+
+def test_limit_wakes_waiters():
+    """Raising the limit wakes waiting reservations."""
+    budget = MemoryBudget(10)
+    budget.acquire(10)
+    waiter = Thread(target=budget.acquire, args=(10,))
+    waiter.start()
+    budget.limit = 20
+    waiter.join()
+    assert budget.used == 20
+
+
+def test_process_wide_budget():
+    """Reads are limited by the process wide budget, and give the same digests."""
+    data = bytes(range(256)) * 4096
+    expected = hashlib.sha256(data).hexdigest()
+    reserved = []
+
+    class Spy:
+        """A hasher recording the budget's usage as it's updated."""
+
+        name = "spy"
+        digest_size = 0
+        block_size = 1
+
+        def update(self, chunk):
+            """Record the usage, and the chunk size."""
+            reserved.append((memory_usage(), len(chunk)))
+
+        def digest(self):
+            """Produce no digest."""
+            return b""
+
+        def hexdigest(self):
+            """Produce no hexdigest."""
+            return ""
+
+        def copy(self):
+            """Don't copy."""
+            return self
+
+    set_memory_budget(131072)
+    try:
+        get_memory_budget().acquire(65536)
+        multihash = MultiHash.from_stream(
+            BytesIO(data), hashers=["sha256", Spy()], chunksize=1048576
+        )
+        get_memory_budget().release(65536)
+    finally:
+        set_memory_budget(None)
+    assert multihash.hexdigest()["sha256"] == expected
+    assert reserved and all(used == 131072 for used, _ in reserved)
+    assert max(size for _, size in reserved) == 65536
+    assert memory_usage() == 0
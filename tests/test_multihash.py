@@ -1,4 +1,5 @@
 """Tests for MultiHash."""
+import hashlib
 from io import BytesIO
 from os import urandom
 from tempfile import NamedTemporaryFile
@@ -73,6 +74,52 @@ def test_stream():
     assert "sha256" in result
 
 
+class _Deferred:
+    """A hasher which keeps its input, and only digests it when asked."""
+
+    name = "deferred"
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self):
+        self.chunks = []
+
+    def update(self, data):
+        """Keep the data, as is."""
+        self.chunks.append(data)
+
+    def copy(self):
+        """Return a copy sharing nothing mutable."""
+        clone = _Deferred()
+        clone.chunks = list(self.chunks)
+        return clone
+
+    def digest(self):
+        """Return the sha256 digest of everything kept."""
+        return hashlib.sha256(b"".join(self.chunks)).digest()
+
+    def hexdigest(self):
+        """Return the sha256 hexdigest of everything kept."""
+        return self.digest().hex()
+
+
+def test_hashers_may_keep_chunks():
+    """Test streams are read into fresh chunks, which hashers may keep."""
+    data = urandom(65536 * 3 + 5)
+    expected = {"deferred": hashlib.sha256(data).hexdigest()}
+    result = MultiHash.from_stream(
+        BytesIO(data), hashers=[_Deferred()], chunksize=65536
+    )
+    assert result.hexdigest() == expected
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        result = MultiHash.from_filepath(
+            test_file.name, hashers=[_Deferred()], chunksize=65536
+        )
+    assert result.hexdigest() == expected
+
+
 def test_hasher_info():
     """Exercise the standard harsher interface."""
     mh = MultiHash.from_stream(BytesIO(urandom(1024)), hashers=["md5", "sha256"])
@@ -97,5 +144,56 @@ def test_hasher_info():
         assert isinstance(value, str)
 
 
+def test_file_range_hash():
+    """Test hashing a byte range of a file matches hashing those bytes."""
+    data = urandom(1024 * 10)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        result = MultiHash.from_filepath(
+            test_file.name, hashers=["md5"], offset=100, length=5000, chunksize=512
+        ).hexdigest()
+        assert result == MultiHash(data[100:5100], hashers=["md5"]).hexdigest()
+        # A range running past the end of the file stops at EOF
+        result = MultiHash.from_filepath(
+            test_file.name, hashers=["md5"], offset=9000, length=5000
+        ).hexdigest()
+        assert result == MultiHash(data[9000:], hashers=["md5"]).hexdigest()
+
+
+def test_file_range_hash_without_pread(monkeypatch):
+    """Test ranges are read by seeking where os.pread isn't available."""
+    monkeypatch.delattr("os.pread")
+    data = urandom(1024 * 10)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        result = MultiHash.from_filepath(
+            test_file.name, hashers=["md5"], offset=100, length=5000, chunksize=512
+        ).hexdigest()
+    assert result == MultiHash(data[100:5100], hashers=["md5"]).hexdigest()
+
+
+def test_from_range_preserves_position():
+    """Test hashing a range of an open file doesn't move its position."""
+    data = urandom(4096)
+    with NamedTemporaryFile() as test_file:
+        test_file.write(data)
+        test_file.flush()
+        test_file.seek(10)
+        result = MultiHash.from_range(
+            test_file, offset=2048, hashers=["sha256"]
+        ).hexdigest()
+        assert test_file.tell() == 10
+    assert result == MultiHash(data[2048:], hashers=["sha256"]).hexdigest()
+
+
+def test_from_range_rejects_negative_offset():
+    """Test a negative offset is refused."""
+    with NamedTemporaryFile() as test_file:
+        with pytest.raises(ValueError):
+            MultiHash.from_range(test_file, offset=-1, hashers=["md5"])
+
+
 if __name__ == "__main__":
     pytest.main()
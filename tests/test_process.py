@@ -0,0 +1,128 @@
+"""Tests for hashing in worker processes through shared memory."""
+import hashlib
+import zlib
+from io import BytesIO
+from os import urandom
+
+import pytest
+
+from multihash import MultiHash
+from multihash.process import SharedMemoryPool
+
+
+class SlowSum:
+    """A pure Python hasher, which holds the GIL."""
+
+    name = "slowsum"
+    digest_size = 4
+    block_size = 1
+
+    def __init__(self):
+        """Start the sum at zero."""
+        self.total = 0
+
+    def update(self, data):
+        """Add up the bytes."""
+        for byte in bytes(data):
+            self.total = (self.total + byte) % 2 ** 32
+
+    def digest(self):
+        """Produce a digest."""
+        return self.total.to_bytes(4, "big")
+
+    def hexdigest(self):
+        """Produce a hexdigest."""
+        return self.digest().hex()
+
+    def copy(self):
+        """Produce a copy of the hasher."""
+        clone = SlowSum()
+        clone.total = self.total
+        return clone
+
+
+class Broken(SlowSum):
+    """A hasher which fails on update."""
+
+    name = "broken"
+
+    def update(self, data):
+        """Fail."""
+        raise RuntimeError("broken hasher")
+
+
+def test_process_hashers_match_local():
+    """Test process backed hashers agree with local ones, across many slots."""
+    data = urandom(5000)
+    with SharedMemoryPool(slots=2, slot_size=256) as pool:
+        hashers = pool.hashers(["md5", SlowSum, "crc32"])
+        hashers.append("sha256")
+        result = MultiHash.from_stream(BytesIO(data), hashers=hashers, chunksize=700)
+        assert result.hexdigest() == {
+            "md5": hashlib.md5(data).hexdigest(),
+            "slowsum": (sum(data) % 2 ** 32).to_bytes(4, "big").hex(),
+            "crc32": "{:08x}".format(zlib.crc32(data)),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        assert result.digest_size["slowsum"] == 4
+
+
+def test_reused_buffer():
+    """Test a mutated buffer passed again is copied again."""
+    buffer = bytearray(b"a" * 100)
+    with SharedMemoryPool(slots=1, slot_size=64) as pool:
+        multihash = MultiHash(hashers=pool.hashers(["md5", "sha1"]))
+        multihash.update(buffer)
+        buffer[:] = b"b" * 100
+        multihash.update(buffer)
+        assert multihash.hexdigest() == {
+            "md5": hashlib.md5(b"a" * 100 + b"b" * 100).hexdigest(),
+            "sha1": hashlib.sha1(b"a" * 100 + b"b" * 100).hexdigest(),
+        }
+
+
+def test_views_not_kept():
+    """Test hashers let go of views, so their buffers may be resized."""
+    buffer = bytearray(b"a" * 100)
+    with SharedMemoryPool(slots=1, slot_size=64) as pool:
+        multihash = MultiHash(hashers=pool.hashers(["md5", "sha1"]))
+        multihash.update(buffer)
+        buffer.extend(b"b" * 100)
+        multihash.update(buffer)
+        assert multihash.hexdigest()["md5"] == hashlib.md5(
+            b"a" * 200 + b"b" * 100
+        ).hexdigest()
+
+
+def test_copy():
+    """Test copies are independent, and live in the same worker."""
+    with SharedMemoryPool(slots=2, slot_size=64) as pool:
+        hasher = pool.hasher("md5")
+        hasher.update(b"some data")
+        clone = hasher.copy()
+        clone.update(b" and more")
+        assert hasher.hexdigest() == hashlib.md5(b"some data").hexdigest()
+        assert clone.hexdigest() == hashlib.md5(b"some data and more").hexdigest()
+        copies = MultiHash(b"x", hashers=[hasher]).copy()
+        assert copies["md5"].hexdigest() == hashlib.md5(b"some datax").hexdigest()
+
+
+def test_errors_propagate():
+    """Test errors raised in workers are raised in the parent."""
+    with SharedMemoryPool(slots=1, slot_size=64) as pool:
+        with pytest.raises(ValueError):
+            pool.hasher("not-a-real-algorithm")
+        hasher = pool.hasher(Broken)
+        hasher.update(b"data")
+        with pytest.raises(RuntimeError):
+            hasher.digest()
+
+
+def test_closed_pool():
+    """Test a closed pool refuses work."""
+    pool = SharedMemoryPool(slots=1, slot_size=64)
+    hasher = pool.hasher("md5")
+    pool.close()
+    pool.close()
+    with pytest.raises(ValueError):
+        hasher.update(b"data")